@@ -0,0 +1,179 @@
+import os
+import random
+import sys
+import time
+
+import django
+
+from django.conf import settings
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SETTINGS = dict(
+    INSTALLED_APPS=[
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "team",
+    ],
+    DATABASES={
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, "bench.sqlite3"),
+        }
+    },
+    MIDDLEWARE_CLASSES=[],
+    ROOT_URLCONF="team.urls",
+    SECRET_KEY="notasecret",
+    USE_TZ=True,
+)
+
+
+def setup(database=None, **overrides):
+    """
+    Configures Django against a throw-away SQLite file and migrates it.
+    ``database`` replaces the file name of every alias, keeping the rest of
+    their settings.
+    """
+    options = dict(DEFAULT_SETTINGS, **overrides)
+    if database is not None:
+        options["DATABASES"] = dict(
+            (alias, dict(config, NAME=database))
+            for alias, config in options["DATABASES"].items()
+        )
+    name = options["DATABASES"]["default"]["NAME"]
+    if name != ":memory:":
+        for path in (name, name + "-wal", name + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    if not settings.configured:
+        settings.configure(**options)
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0, interactive=False)
+
+# ------------------------------------------------------------------------------
+
+def default_status_mix():
+    from team.models import MembershipStatus
+    return {
+        MembershipStatus.ACCEPTED: 0.70,
+        MembershipStatus.APPLIED: 0.10,
+        MembershipStatus.INVITED: 0.10,
+        MembershipStatus.DECLINED: 0.05,
+        MembershipStatus.REJECTED: 0.05,
+    }
+
+
+def default_role_mix():
+    from team.models import MembershipRole
+    return {
+        MembershipRole.MEMBER: 0.90,
+        MembershipRole.MANAGER: 0.08,
+        MembershipRole.OWNER: 0.02,
+    }
+
+
+def _weighted(mix, rng):
+    choices, total = [], 0.0
+    for value, weight in sorted(mix.items()):
+        total += weight
+        choices.append((total, value))
+
+    def pick():
+        point = rng.random() * total
+        for bound, value in choices:
+            if point <= bound:
+                return value
+        return choices[-1][1]
+    return pick
+
+
+def _insert(cursor, table, columns, rows, chunk_size=10000):
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        table, ", ".join(columns), ", ".join(["%s"] * len(columns))
+    )
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(sql, rows[start:start + chunk_size])
+
+
+def seed(teams, users, memberships, big_team_share=0.0, status_mix=None,
+         role_mix=None, random_seed=42):
+    """
+    Bulk loads users, teams and memberships with raw inserts. The first team
+    receives ``big_team_share`` of all memberships, the rest are spread
+    evenly. Returns the ids of the created teams and users.
+    """
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from django.utils.six import StringIO
+
+    from team.models import Team, Membership
+
+    rng = random.Random(random_seed)
+    pick_status = _weighted(status_mix or default_status_mix(), rng)
+    pick_role = _weighted(role_mix or default_role_mix(), rng)
+    now = timezone.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+    User = get_user_model()
+
+    big = int(memberships * big_team_share)
+    per_team = (memberships - big) // max(teams - 1, 1) if teams > 1 else 0
+    if max(big, per_team) > users:
+        raise ValueError("not enough users for the largest team")
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+        _insert(cursor, User._meta.db_table, [
+            "password", "is_superuser", "username", "first_name", "last_name",
+            "email", "is_staff", "is_active", "date_joined",
+        ], [
+            ("!", False, "user%d" % i, "", "", "user%d@example.org" % i,
+             False, True, now)
+            for i in range(users)
+        ])
+        user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+
+        Team.objects.bulk_create([
+            Team(name="team%d" % i, creator_id=user_ids[i % users])
+            for i in range(teams)
+        ], batch_size=500)
+        team_ids = list(Team.objects.order_by("pk").values_list("pk", flat=True))
+
+        columns = ["team_id", "user_id", "role", "status", "created_at"]
+        for index, team_id in enumerate(team_ids):
+            size = big if index == 0 and big else per_team
+            _insert(cursor, Membership._meta.db_table, columns, [
+                (team_id, user_id, pick_role(), pick_status(), now)
+                for user_id in rng.sample(user_ids, size)
+            ])
+
+    call_command("rebuild_team_counters", stdout=StringIO())
+    return team_ids, user_ids
+
+# ------------------------------------------------------------------------------
+
+def measure(func, repeat=20, prepare=None):
+    """
+    Runs ``func`` ``repeat`` times and returns latency statistics in ms. With
+    ``prepare``, its return value is passed to ``func`` and the time spent in
+    it is not counted.
+    """
+    timings = []
+    for _ in range(repeat):
+        args = (prepare(),) if prepare is not None else ()
+        started = time.time()
+        func(*args)
+        timings.append((time.time() - started) * 1000.0)
+    timings.sort()
+    return {
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "max_ms": round(timings[-1], 3),
+    }
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Measures query counts and latencies of the team and membership hot paths on
+a seeded SQLite dataset and compares them with a previous run.
+
+    python -m benchmarks.hot_paths --output current.json
+    python -m benchmarks.hot_paths --baseline current.json
+
+A run fails when a path needs more queries than in the baseline, or when its
+median latency grew by more than ``--max-slowdown`` (and by at least
+``--min-delta-ms``, to ignore noise on sub-millisecond paths).
+"""
+import argparse
+import itertools
+import json
+import platform
+import sys
+
+from benchmarks import base
+
+
+def paths(team, viewer, owner):
+    """
+    Returns ``(name, func, prepare)`` for every measured path. ``prepare``
+    builds the fresh state a single call of ``func`` consumes, or is None.
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+
+    from team.models import Membership, MembershipRole, MembershipStatus
+    from team.resolver import membership_scope
+    from team.views import TeamCreateView, TeamListView
+
+    User = get_user_model()
+    factory = RequestFactory()
+    counter = itertools.count()
+    list_view = TeamListView.as_view()
+    create_view = TeamCreateView.as_view(success_url="/")
+
+    def new_user():
+        return User.objects.create(username="bench%d" % next(counter))
+
+    def new_membership(role, status):
+        def prepare():
+            return Membership.objects.create(
+                team=team, user=new_user(), role=role, status=status
+            )
+        return prepare
+
+    def get_list(user, query=""):
+        def run():
+            request = factory.get("/" + query)
+            request.user = user
+            list_view(request)
+        return run
+
+    def post_create():
+        request = factory.post("/create/", {"name": "bench team", "description": ""})
+        request.user = owner
+        response = create_view(request)
+        assert response.status_code == 302, response.status_code
+
+    def scoped(func):
+        def run():
+            with membership_scope():
+                func()
+        return run
+
+    def second_page():
+        request = factory.get("/")
+        request.user = viewer
+        response = list_view(request)
+        return "?after=" + (response.context_data["next_cursor"] or "")
+
+    return [
+        ("role_for", lambda: team.role_for(viewer), None),
+        ("is_on_team", lambda: team.is_on_team(viewer), None),
+        ("predicates_in_scope", scoped(lambda: (
+            team.role_for(viewer), team.is_on_team(viewer),
+            team.is_owner_or_manager(viewer), team.status_for(viewer),
+        )), None),
+        ("team_list_anonymous", get_list(AnonymousUser()), None),
+        ("team_list_member", get_list(viewer), None),
+        ("team_list_next_page", lambda query: get_list(viewer, query)(), second_page),
+        ("team_create", post_create, None),
+        ("add_user", lambda user: team.add_user(user, MembershipRole.MEMBER), new_user),
+        ("promote", lambda m: m.promote(owner),
+         new_membership(MembershipRole.MEMBER, MembershipStatus.ACCEPTED)),
+        ("demote", lambda m: m.demote(owner),
+         new_membership(MembershipRole.MANAGER, MembershipStatus.ACCEPTED)),
+        ("accept", lambda m: m.accept(owner),
+         new_membership(MembershipRole.MEMBER, MembershipStatus.APPLIED)),
+        ("reject", lambda m: m.reject(owner),
+         new_membership(MembershipRole.MEMBER, MembershipStatus.APPLIED)),
+    ]
+
+
+def run(team, viewer, owner, repeat):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    results = {}
+    for name, func, prepare in paths(team, viewer, owner):
+        args = (prepare(),) if prepare is not None else ()
+        with CaptureQueriesContext(connection) as queries:
+            func(*args)
+        results[name] = dict(
+            base.measure(func, repeat, prepare),
+            queries=len(queries),
+        )
+    return results
+
+
+def compare(results, baseline, max_slowdown, min_delta_ms):
+    failures = []
+    for name in sorted(results):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        after = results[name]
+        if after["queries"] > before["queries"]:
+            failures.append("%s: %d queries, was %d" % (
+                name, after["queries"], before["queries"]
+            ))
+        delta = after["median_ms"] - before["median_ms"]
+        if delta >= min_delta_ms and after["median_ms"] > before["median_ms"] * max_slowdown:
+            failures.append("%s: median %.3f ms, was %.3f ms" % (
+                name, after["median_ms"], before["median_ms"]
+            ))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default=None)
+    parser.add_argument("--teams", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--memberships", type=int, default=200000)
+    parser.add_argument("--big-team-share", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    parser.add_argument("--min-delta-ms", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    base.setup(args.database)
+
+    import django
+    from team.models import Membership, MembershipRole, MembershipStatus, Team
+
+    team_ids, user_ids = base.seed(
+        args.teams, args.users, args.memberships, args.big_team_share
+    )
+    team = Team.objects.get(pk=team_ids[0])
+    viewer = team.acceptances.filter(role=MembershipRole.MEMBER)[0].user
+    owner = Membership.objects.filter(
+        team=team, role=MembershipRole.OWNER,
+        status__in=MembershipStatus.ACCEPTED_STATUSES,
+    )[0].user
+
+    results = run(team, viewer, owner, args.repeat)
+    for name, result in sorted(results.items()):
+        print("%-22s %3d queries %10.3f ms median %10.3f ms p95" % (
+            name, result["queries"], result["median_ms"], result["p95_ms"]
+        ))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({
+                "dataset": {
+                    "teams": args.teams,
+                    "users": args.users,
+                    "memberships": args.memberships,
+                    "big_team_share": args.big_team_share,
+                },
+                "environment": {
+                    "python": platform.python_version(),
+                    "django": django.get_version(),
+                },
+                "results": results,
+            }, fp, indent=2, sort_keys=True)
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as fp:
+            failures = compare(
+                results, json.load(fp)["results"], args.max_slowdown, args.min_delta_ms
+            )
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
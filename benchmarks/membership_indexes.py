@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Seeds a large membership table into SQLite and compares the query plans and
+latencies of the Membership access patterns with and without the composite
+indexes from ``team/migrations/0004_membership_indexes.py``.
+
+    python -m benchmarks.membership_indexes --memberships 1000000
+"""
+import argparse
+import json
+import re
+import sys
+
+from benchmarks import base
+
+
+# column lists of the indexes declared in Membership.Meta.index_together
+COMPOSITE_INDEXES = [
+    ("team_id", "status", "role", "user_id"),
+    ("user_id", "status"),
+]
+
+FULL_SCAN = re.compile(r"\bSCAN (TABLE )?team_membership\b(?! USING)")
+
+
+def predicates(team, user):
+    from team.models import Membership, MembershipRole, MembershipStatus
+
+    return [
+        ("applicants", team.applicants),
+        ("invitees", team.invitees),
+        ("acceptances", team.acceptances),
+        ("members", team.members),
+        ("managers", team.managers),
+        ("owners", team.owners),
+        ("is_owner_or_manager", team.acceptances.filter(
+            role__in=[MembershipRole.OWNER, MembershipRole.MANAGER],
+            user=user,
+        )),
+        ("for_user", team.memberships.filter(user=user)),
+        ("user_acceptances", Membership.objects.filter(
+            user=user,
+            status__in=MembershipStatus.ACCEPTED_STATUSES,
+        )),
+    ]
+
+
+def composite_indexes(cursor):
+    found = {}
+    cursor.execute("PRAGMA index_list(team_membership)")
+    for row in cursor.fetchall():
+        name = row[1]
+        cursor.execute("PRAGMA index_info(%s)" % name)
+        columns = tuple(info[2] for info in cursor.fetchall())
+        if columns in COMPOSITE_INDEXES:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = %s",
+                [name],
+            )
+            found[name] = cursor.fetchone()[0]
+    return found
+
+
+def run(team, user, repeat):
+    from django.db import connection
+
+    results = {}
+    cursor = connection.cursor()
+    cursor.execute("ANALYZE")
+    for name, queryset in predicates(team, user):
+        sql, params = queryset.values_list("pk", flat=True).query.sql_with_params()
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        plan = " / ".join(row[-1] for row in cursor.fetchall())
+
+        def execute():
+            cursor.execute(sql, params)
+            cursor.fetchall()
+
+        results[name] = dict(base.measure(execute, repeat), plan=plan)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default=None)
+    parser.add_argument("--teams", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=250000)
+    parser.add_argument("--memberships", type=int, default=1000000)
+    parser.add_argument("--big-team-share", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    base.setup(args.database)
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from team.models import Team
+
+    team_ids, user_ids = base.seed(
+        args.teams, args.users, args.memberships, args.big_team_share
+    )
+    team = Team.objects.get(pk=team_ids[0])
+    user = get_user_model().objects.get(
+        pk=team.memberships.values_list("user_id", flat=True)[0]
+    )
+
+    cursor = connection.cursor()
+    indexes = composite_indexes(cursor)
+    if len(indexes) != len(COMPOSITE_INDEXES):
+        sys.exit("composite membership indexes are missing, run the migrations")
+
+    for name in indexes:
+        cursor.execute("DROP INDEX %s" % name)
+    before = run(team, user, args.repeat)
+    for sql in indexes.values():
+        cursor.execute(sql)
+    after = run(team, user, args.repeat)
+
+    failures = []
+    for name in sorted(after):
+        plan = after[name]["plan"]
+        if FULL_SCAN.search(plan) or "INDEX" not in plan:
+            failures.append("%s does not use an index: %s" % (name, plan))
+        print("%-20s %10.3f ms -> %10.3f ms   %s" % (
+            name, before[name]["median_ms"], after[name]["median_ms"], plan
+        ))
+    if not any(index in after[name]["plan"] for index in indexes for name in after):
+        failures.append("no predicate picked a composite index")
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"before": before, "after": after}, fp, indent=2, sort_keys=True)
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
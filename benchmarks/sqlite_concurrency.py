@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Runs concurrent reader and writer processes against one SQLite file and
+reports their throughput, once with the stock settings (rollback journal,
+single connection) and once with the production profile from
+``first.production`` (WAL, busy_timeout, synchronous=NORMAL, mmap and reads
+through the query-only replica connection).
+
+    python -m benchmarks.sqlite_concurrency --writers 4 --readers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from django.utils.six.moves.queue import Empty
+
+from benchmarks import base
+
+# how long past --duration the workers may take to report
+REPORT_TIMEOUT = 60
+
+
+def profile_settings(profile, database):
+    if profile == "baseline":
+        return {}
+    from first import production
+    options = dict(production.DATABASES["default"], NAME=database)
+    return dict(
+        INSTALLED_APPS=base.DEFAULT_SETTINGS["INSTALLED_APPS"] + ["first"],
+        DATABASES={
+            "default": options,
+            "replica": dict(production.DATABASES["replica"], NAME=database),
+        },
+        DATABASE_ROUTERS=production.DATABASE_ROUTERS,
+        SQLITE_PRAGMAS=production.SQLITE_PRAGMAS,
+        SQLITE_READ_ONLY_DATABASES=production.SQLITE_READ_ONLY_DATABASES,
+    )
+
+
+def writer(team_id, duration, queue, index):
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError
+    from team.models import MembershipRole, Team
+
+    User = get_user_model()
+    team = Team.objects.get(pk=team_id)
+    ops = errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        try:
+            user = User.objects.create(username="w%d-%d" % (index, ops + errors))
+            # an INSERT and an UPDATE, each in its own transaction
+            team.add_user(user, MembershipRole.MEMBER).save()
+            ops += 1
+        except OperationalError:
+            errors += 1
+    queue.put(("write", ops, errors))
+
+
+def reader(team_id, user_ids, duration, queue, index):
+    from django.db import OperationalError
+    from team.models import Team
+
+    team = Team.objects.get(pk=team_id)
+    ops = errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        try:
+            team.role_for(user_ids[(index + ops) % len(user_ids)])
+            list(Team.objects.with_membership_for(None).seek()[:25])
+            ops += 1
+        except OperationalError:
+            errors += 1
+    queue.put(("read", ops, errors))
+
+
+def run_profile(profile, args):
+    database = args.database or os.path.join(base.BASE_DIR, "bench-%s.sqlite3" % profile)
+    base.setup(database, **profile_settings(profile, database))
+
+    from django.db import connections
+
+    team_ids, user_ids = base.seed(args.teams, args.users, args.memberships, 0.2)
+    # the workers are forked and must open their own connections
+    connections.close_all()
+
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=writer, args=(team_ids[0], args.duration, queue, i)
+        )
+        for i in range(args.writers)
+    ] + [
+        multiprocessing.Process(
+            target=reader, args=(team_ids[0], user_ids, args.duration, queue, i)
+        )
+        for i in range(args.readers)
+    ]
+    started = time.time()
+    for process in processes:
+        process.start()
+    totals = {"read": [0, 0], "write": [0, 0]}
+    reports, deadline = 0, started + args.duration + REPORT_TIMEOUT
+    try:
+        while reports < len(processes):
+            try:
+                kind, ops, errors = queue.get(timeout=1)
+            except Empty:
+                # a worker that died never reports, don't wait for it forever
+                failed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError("%s workers failed, exit codes %s" % (profile, failed))
+                if time.time() > deadline:
+                    raise RuntimeError("%s workers did not report in time" % profile)
+                continue
+            totals[kind][0] += ops
+            totals[kind][1] += errors
+            reports += 1
+    finally:
+        for process in processes:
+            if process.is_alive() and reports < len(processes):
+                process.terminate()
+            process.join()
+    elapsed = time.time() - started
+
+    return {
+        "reads_per_second": round(totals["read"][0] / elapsed, 1),
+        "writes_per_second": round(totals["write"][0] / elapsed, 1),
+        "read_errors": totals["read"][1],
+        "write_errors": totals["write"][1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=["baseline", "tuned"], default=None)
+    parser.add_argument("--database", default=None)
+    parser.add_argument("--teams", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--memberships", type=int, default=50000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        # one profile per process, Django can only be configured once
+        print(json.dumps(run_profile(args.profile, args)))
+        return 0
+
+    results = {}
+    for profile in ("baseline", "tuned"):
+        output = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.sqlite_concurrency", "--profile", profile]
+            + (argv if argv is not None else sys.argv[1:]),
+            cwd=base.BASE_DIR,
+        )
+        results[profile] = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+        print("%-9s %10.1f reads/s %10.1f writes/s %6d read errors %6d write errors" % (
+            profile,
+            results[profile]["reads_per_second"],
+            results[profile]["writes_per_second"],
+            results[profile]["read_errors"],
+            results[profile]["write_errors"],
+        ))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Starts gunicorn with ``config/gunicorn.py``, with and without preload_app,
+and reports how long it takes until the first request is answered and the
+RSS and PSS of the master and every worker (Linux only, from
+``/proc/<pid>/smaps_rollup``). PSS splits shared pages between the
+processes that map them, so it shows what copy-on-write sharing saves.
+
+    python -m benchmarks.startup --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks import base
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def memory(pid):
+    """
+    Returns ``(rss_kb, pss_kb)`` of the process.
+    """
+    values = {}
+    path = "/proc/%d/smaps_rollup" % pid
+    if not os.path.exists(path):
+        path = "/proc/%d/smaps" % pid
+    with open(path) as fp:
+        for line in fp:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = values.get(parts[0], 0) + int(parts[1])
+    return values.get("Rss:", 0), values.get("Pss:", 0)
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as fp:
+                stat = fp.read()
+        except IOError:
+            continue
+        # the command name may contain spaces, the ppid follows the ")"
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            found.append(int(entry))
+    return sorted(found)
+
+
+def wait_for_response(port, deadline):
+    request = b"GET / HTTP/1.0\r\nHost: 127.0.0.1\r\n\r\n"
+    while time.time() < deadline:
+        try:
+            sock = socket.create_connection(("127.0.0.1", port), timeout=1)
+            sock.sendall(request)
+            answered = sock.recv(12).startswith(b"HTTP/")
+            sock.close()
+            if answered:
+                return True
+        except (IOError, OSError):
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def run(preload, args):
+    port = free_port()
+    env = dict(
+        os.environ,
+        GUNICORN_BIND="127.0.0.1:%d" % port,
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        GUNICORN_PRELOAD="1" if preload else "0",
+        DJANGO_SETTINGS_MODULE=args.settings,
+    )
+    started = time.time()
+    process = subprocess.Popen(
+        ["gunicorn", "-c", "config/gunicorn.py", "first.wsgi:application"],
+        cwd=base.BASE_DIR, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    )
+    try:
+        if not wait_for_response(port, started + args.timeout):
+            raise SystemExit("gunicorn did not answer within %ss" % args.timeout)
+        first_response = time.time() - started
+        # every worker has to be up before memory is compared
+        while len(children(process.pid)) < args.workers:
+            if time.time() > started + args.timeout:
+                raise SystemExit("workers did not start within %ss" % args.timeout)
+            time.sleep(0.05)
+        for i in range(args.workers * 4):
+            wait_for_response(port, time.time() + 5)
+
+        workers = [memory(pid) for pid in children(process.pid)]
+        master = memory(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+    return {
+        "first_response_s": round(first_response, 3),
+        "master_rss_kb": master[0],
+        "master_pss_kb": master[1],
+        "worker_rss_kb": [rss for rss, pss in workers],
+        "worker_pss_kb": [pss for rss, pss in workers],
+        "total_pss_kb": master[1] + sum(pss for rss, pss in workers),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--settings", default="first.production")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, preload in (("no_preload", False), ("preload", True)):
+        result = results[name] = run(preload, args)
+        print("%-10s first response %6.3f s   worker RSS %s kB   total PSS %d kB" % (
+            name,
+            result["first_response_s"],
+            "/".join(str(rss) for rss in result["worker_rss_kb"]),
+            result["total_pss_kb"],
+        ))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
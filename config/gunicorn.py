@@ -0,0 +1,65 @@
+"""
+gunicorn settings, used by run_wsgi.sh and config/supervisord.conf:
+
+    gunicorn -c config/gunicorn.py first.wsgi:application
+
+Everything can be overridden from the environment (GUNICORN_*).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+
+# "gthread" keeps a worker responsive while some of its threads wait on slow
+# clients or the database; "sync" is one request per process.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4 if worker_class == "gthread" else 1))
+
+_cpus = multiprocessing.cpu_count()
+workers = int(os.environ.get(
+    "GUNICORN_WORKERS", _cpus + 1 if worker_class == "gthread" else 2 * _cpus + 1
+))
+
+# import Django and the apps once in the master; workers share those pages
+# copy-on-write instead of each importing them again
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# recycle workers now and then so leaks and fragmentation can't pile up; the
+# jitter keeps them from restarting all at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+
+# the heartbeat file is touched constantly, keep it off the disk
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+raw_env = [
+    "DJANGO_SETTINGS_MODULE=%s" % os.environ.get(
+        "DJANGO_SETTINGS_MODULE", "first.production"
+    ),
+]
+
+
+def post_fork(server, worker):
+    # connections opened while preloading belong to the master; a worker must
+    # never use a SQLite handle that was opened before the fork
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
+
+
+def worker_exit(server, worker):
+    # gunicorn 19.3 has no child_exit; worker_exit runs in the worker itself
+    # as it exits, max_requests recycling included. It also runs in the
+    # master for workers that were already gone, whose pid it cannot tell.
+    # Without this every recycled worker would leave its request metrics
+    # behind in METRICS_DIR.
+    if os.getpid() == server.pid:
+        return
+    from first import metrics
+    metrics.flush(force=True)
+    metrics.retire_worker(os.getpid())
@@ -0,0 +1 @@
+default_app_config = "first.apps.FirstConfig"
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class FirstConfig(AppConfig):
+
+    name = "first"
+
+    def ready(self):
+        from .db import apply_pragmas
+        connection_created.connect(apply_pragmas)
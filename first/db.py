@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import connections
+
+# ------------------------------------------------------------------------------
+# SQLite tuning, applied to every new connection by first.apps.FirstConfig.
+# SQLITE_PRAGMAS are run on all SQLite connections, journal_mode only on
+# writable ones; the aliases in SQLITE_READ_ONLY_DATABASES additionally get
+# query_only so a stray write through them fails instead of taking the lock.
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    read_only = connection.alias in getattr(settings, "SQLITE_READ_ONLY_DATABASES", ())
+    pragmas = list(getattr(settings, "SQLITE_PRAGMAS", {}).items())
+    if read_only:
+        pragmas = [(name, value) for name, value in pragmas if name != "journal_mode"]
+        pragmas.append(("query_only", "ON"))
+    cursor = connection.cursor()
+    for name, value in pragmas:
+        cursor.execute("PRAGMA %s = %s" % (name, value))
+
+# ------------------------------------------------------------------------------
+
+class ReadReplicaRouter(object):
+    """
+    Sends reads of REPLICA_MODELS to the ``replica`` database unless the
+    default connection is inside a transaction, where a read has to see the
+    transaction's own writes. Everything else uses ``default``.
+    """
+
+    replica = "replica"
+    models = ("team.team", "team.membership")
+
+    def _label(self, model):
+        return "%s.%s" % (model._meta.app_label, model._meta.model_name)
+
+    def db_for_read(self, model, **hints):
+        models = getattr(settings, "REPLICA_MODELS", self.models)
+        if self._label(model) in models and not connections["default"].in_atomic_block:
+            return self.replica
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != self.replica
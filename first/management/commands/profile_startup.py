@@ -0,0 +1,154 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: loads the WSGI application and the URLconf the
+# way a worker does before its first request and reports what that cost.
+# Imports are timed by wrapping __import__, which works on every Python
+# Django supports (-X importtime needs 3.7): each module that was not loaded
+# yet gets its cumulative time and its own time without nested imports.
+CHILD = """
+import json, os, resource, sys, time
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+original_import = builtins.__import__
+# Python 2 tries implicit relative imports first unless told otherwise
+default_level = -1 if sys.version_info[0] == 2 else 0
+imports = {}
+nested = []
+
+
+def resolve(name, globals, level):
+    if not level or not globals:
+        return name
+    package = globals.get("__package__") or globals.get("__name__", "")
+    if not globals.get("__package__") and "__path__" not in globals:
+        package = package.rpartition(".")[0]
+    if level > 1:
+        package = package.rsplit(".", level - 1)[0]
+    return package + "." + name if name else package
+
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=default_level):
+    candidates = [resolve(name, globals, max(level, 1)), name] if level < 0 \\
+        else [resolve(name, globals, level)]
+    # Python 2 caches failed implicit relative imports as None
+    if any(sys.modules.get(candidate) is not None for candidate in candidates):
+        return original_import(name, globals, locals, fromlist, level)
+    nested.append(0.0)
+    started = time.time()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.time() - started
+        own = cumulative - nested.pop()
+        if nested:
+            nested[-1] += cumulative
+        for candidate in candidates:
+            if sys.modules.get(candidate) is not None:
+                imports[candidate] = (int(own * 1e6), int(cumulative * 1e6))
+                break
+
+
+started = time.time()
+builtins.__import__ = timed_import
+os.environ["DJANGO_SETTINGS_MODULE"] = sys.argv[1]
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+setup = time.time()
+from django.core.urlresolvers import get_resolver
+get_resolver(None).url_patterns
+done = time.time()
+builtins.__import__ = original_import
+sys.stdout.write(json.dumps({
+    "setup_s": setup - started,
+    "urls_s": done - setup,
+    "total_s": done - started,
+    "modules": len(sys.modules),
+    "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "imports": [[name] + list(times) for name, times in imports.items()],
+}))
+"""
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Reports the startup cost of the given settings modules (default: "
+        "the current one): time to load the WSGI application and URLconf, "
+        "peak memory, and the slowest imports grouped by top-level package."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("settings_modules", nargs="*")
+        parser.add_argument("--limit", type=int, default=15,
+                            help="number of packages and modules to list")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="runs per settings module, the median is reported")
+        parser.add_argument("--json", action="store_true", default=False)
+
+    def handle(self, *args, **options):
+        modules = options["settings_modules"] or [os.environ["DJANGO_SETTINGS_MODULE"]]
+        results = {}
+        for module in modules:
+            runs = sorted(
+                (self.profile(module) for i in range(max(options["repeat"], 1))),
+                key=lambda result: result["total_s"],
+            )
+            results[module] = runs[len(runs) // 2]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for module in modules:
+            self.report(module, results[module], options["limit"])
+
+    def profile(self, module):
+        process = subprocess.Popen(
+            [sys.executable, "-c", CHILD, module],
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        stdout, stderr = process.communicate()
+        stderr = stderr.decode("utf-8", "replace")
+        if process.returncode:
+            raise CommandError("loading %s failed:\n%s" % (module, stderr))
+        result = json.loads(stdout.decode("utf-8"))
+
+        imports = result.pop("imports")
+        packages = defaultdict(int)
+        for name, self_us, cumulative_us in imports:
+            packages[name.split(".")[0]] += self_us
+        result["packages_ms"] = dict(
+            (name, round(us / 1000.0, 1)) for name, us in packages.items()
+        )
+        result["imports_ms"] = dict(
+            (name, round(cumulative_us / 1000.0, 1))
+            for name, self_us, cumulative_us in imports
+        )
+        return result
+
+    def report(self, module, result, limit):
+        self.stdout.write(
+            "%s: %.3f s (setup %.3f s, URLconf %.3f s), %d modules, peak RSS %d kB" % (
+                module, result["total_s"], result["setup_s"], result["urls_s"],
+                result["modules"], result["maxrss_kb"],
+            )
+        )
+        for title, key in (("packages (self time)", "packages_ms"),
+                           ("imports (cumulative)", "imports_ms")):
+            if not result[key]:
+                continue
+            self.stdout.write("  %s:" % title)
+            ranked = sorted(result[key].items(), key=lambda item: -item[1])
+            for name, ms in ranked[:limit]:
+                self.stdout.write("    %8.1f ms  %s" % (ms, name))
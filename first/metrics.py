@@ -0,0 +1,319 @@
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+# ------------------------------------------------------------------------------
+# Request metrics, collected on a sample of requests and kept per process.
+# With METRICS_DIR set every worker also writes its totals there and the
+# metrics view adds up the files of all workers, plus the archive holding
+# the totals of the workers that have exited.
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# distinct duplicate-query fingerprints kept per process
+MAX_FINGERPRINTS = 500
+
+
+class Histogram(object):
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.samples = {}
+
+    def observe(self, labels, value):
+        sample = self.samples.get(labels)
+        if sample is None:
+            sample = self.samples[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample[i] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+    def merge(self, labels, sample):
+        current = self.samples.setdefault(labels, [0] * len(sample))
+        for i, value in enumerate(sample):
+            current[i] += value
+
+    def lines(self, label_names):
+        for labels, sample in sorted(self.samples.items()):
+            base = list(zip(label_names, labels))
+            for bound, count in zip(self.buckets, sample):
+                yield self.name + "_bucket", base + [("le", repr(float(bound)))], count
+            yield self.name + "_bucket", base + [("le", "+Inf")], sample[-1]
+            yield self.name + "_sum", base, sample[-2]
+            yield self.name + "_count", base, sample[-1]
+
+
+class CounterMetric(object):
+
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.samples = {}
+
+    def inc(self, labels, value=1):
+        self.samples[labels] = self.samples.get(labels, 0) + value
+
+    def merge(self, labels, value):
+        self.inc(labels, value)
+
+    def lines(self, label_names):
+        for labels, value in sorted(self.samples.items()):
+            yield self.name, list(zip(label_names, labels)), value
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = [
+            (Histogram(
+                "django_request_duration_seconds",
+                "Total time spent in the view and middleware.",
+                TIME_BUCKETS,
+            ), ("view",)),
+            (Histogram(
+                "django_db_duration_seconds",
+                "Time spent in database queries per request.",
+                TIME_BUCKETS,
+            ), ("view",)),
+            (Histogram(
+                "django_db_queries",
+                "Database queries per request.",
+                QUERY_BUCKETS,
+            ), ("view",)),
+            (CounterMetric(
+                "django_duplicate_queries_total",
+                "Queries repeated within a single request, by fingerprint.",
+            ), ("view", "fingerprint", "sql")),
+        ]
+        self.flushed_at = 0
+
+    def get(self, name):
+        for metric, label_names in self.metrics:
+            if metric.name == name:
+                return metric
+
+    def record(self, view, duration, db_duration, queries, duplicates):
+        with self.lock:
+            self.get("django_request_duration_seconds").observe((view,), duration)
+            self.get("django_db_duration_seconds").observe((view,), db_duration)
+            self.get("django_db_queries").observe((view,), queries)
+            counter = self.get("django_duplicate_queries_total")
+            for (fingerprint, sql), count in duplicates.items():
+                labels = (view, fingerprint, sql)
+                if labels in counter.samples or len(counter.samples) < MAX_FINGERPRINTS:
+                    counter.inc(labels, count)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(
+                (metric.name, [[list(labels), value] for labels, value in metric.samples.items()])
+                for metric, label_names in self.metrics
+            )
+
+    def render(self, snapshots=()):
+        merged = Registry()
+        merged.merge(self.snapshot())
+        for snapshot in snapshots:
+            merged.merge(snapshot)
+        output = []
+        for metric, label_names in merged.metrics:
+            output.append("# HELP %s %s" % (metric.name, metric.documentation))
+            output.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, labels, value in metric.lines(label_names):
+                output.append("%s{%s} %s" % (name, ",".join(
+                    '%s="%s"' % (key, _escape(label)) for key, label in labels
+                ), value))
+        return "\n".join(output) + "\n"
+
+    def merge(self, snapshot):
+        for metric, label_names in self.metrics:
+            for labels, value in snapshot.get(metric.name, ()):
+                metric.merge(tuple(labels), value)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+# ------------------------------------------------------------------------------
+
+NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+STRING = re.compile(r"'(?:[^']|'')*'")
+IN_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)*\s*\)")
+
+
+def fingerprint(sql):
+    """
+    Returns ``(digest, normalized sql)`` with literals replaced by ``?`` so
+    that the same statement with different parameters shares a fingerprint.
+    """
+    normalized = IN_LIST.sub("(...)", NUMBER.sub("?", STRING.sub("?", sql)))
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    return digest, normalized[:200]
+
+
+def _sample_rate():
+    return getattr(settings, "METRICS_SAMPLE_RATE", 0.0)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match.func.__name__
+
+
+class QueryMetricsMiddleware(object):
+    """
+    Records total time, query count, database time and repeated queries for
+    a METRICS_SAMPLE_RATE share of requests. Query logging is only turned on
+    for the sampled ones.
+    """
+
+    def process_request(self, request):
+        if random.random() >= _sample_rate():
+            return
+        request._metrics = (time.time(), [
+            (connection, connection.force_debug_cursor, len(connection.queries_log))
+            for connection in connections.all()
+        ])
+        for connection in connections.all():
+            connection.force_debug_cursor = True
+
+    def process_response(self, request, response):
+        state = getattr(request, "_metrics", None)
+        if state is None:
+            return response
+        started, logs = state
+        queries = []
+        for connection, forced, start in logs:
+            connection.force_debug_cursor = forced
+            queries.extend(itertools.islice(connection.queries_log, start, None))
+
+        duplicates = Counter(fingerprint(query["sql"]) for query in queries)
+        registry.record(
+            _view_name(request),
+            time.time() - started,
+            sum(float(query["time"]) for query in queries),
+            len(queries),
+            dict((key, count - 1) for key, count in duplicates.items() if count > 1),
+        )
+        flush()
+        return response
+
+# ------------------------------------------------------------------------------
+
+ARCHIVE = "archive.json"
+LOCK = "archive.lock"
+
+
+def _write(directory, name, snapshot):
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(snapshot, fp)
+    os.rename(path, os.path.join(directory, name))
+
+
+def _read(directory, name):
+    with open(os.path.join(directory, name)) as fp:
+        return json.load(fp)
+
+
+@contextmanager
+def _locked(directory, operation):
+    # retire_worker moves totals between two files; readers take a shared
+    # lock so they never see them in both or in neither
+    with open(os.path.join(directory, LOCK), "a") as fp:
+        fcntl.flock(fp, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def flush(force=False):
+    """
+    Writes this process' totals to METRICS_DIR, at most every
+    METRICS_FLUSH_INTERVAL seconds unless ``force`` is set.
+    """
+    directory = getattr(settings, "METRICS_DIR", None)
+    now = time.time()
+    if not directory:
+        return
+    if not force and now - registry.flushed_at < getattr(settings, "METRICS_FLUSH_INTERVAL", 10):
+        return
+    registry.flushed_at = now
+    _write(directory, "%d.json" % os.getpid(), registry.snapshot())
+
+
+def retire_worker(pid):
+    """
+    Folds the totals of a worker that has exited into METRICS_DIR's archive
+    and removes its file. Its series stay in the merged totals, so counters
+    and histograms never go backwards when workers are recycled, which
+    Prometheus would read as a reset.
+    """
+    directory = getattr(settings, "METRICS_DIR", None)
+    if not directory:
+        return
+    name = "%d.json" % pid
+    with _locked(directory, fcntl.LOCK_EX):
+        try:
+            snapshot = _read(directory, name)
+        except (IOError, OSError):
+            return
+        archive = Registry()
+        if os.path.exists(os.path.join(directory, ARCHIVE)):
+            archive.merge(_read(directory, ARCHIVE))
+        archive.merge(snapshot)
+        _write(directory, ARCHIVE, archive.snapshot())
+        os.remove(os.path.join(directory, name))
+
+
+def _worker_snapshots():
+    directory = getattr(settings, "METRICS_DIR", None)
+    if not directory:
+        return []
+    own = "%d.json" % os.getpid()
+    with _locked(directory, fcntl.LOCK_SH):
+        return [
+            _read(directory, name) for name in os.listdir(directory)
+            if name.endswith(".json") and name != own
+        ]
+
+
+def metrics_view(request):
+    # scraped straight from the app server; anything that came through the
+    # proxy carries X-Forwarded-For and its REMOTE_ADDR is the proxy's
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ())
+    if "HTTP_X_FORWARDED_FOR" in request.META or request.META.get("REMOTE_ADDR") not in allowed:
+        raise Http404
+    return HttpResponse(
+        registry.render(_worker_snapshots()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,68 @@
+"""
+Production settings: ``DJANGO_SETTINGS_MODULE=first.production``.
+
+SQLite runs in WAL mode so that readers no longer block on the writer, and
+Team/Membership reads go through a separate query-only connection.
+"""
+
+from .settings import *  # noqa
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'example.org').split(',')
+
+SECRET_KEY = os.environ.get('SECRET_KEY', SECRET_KEY)
+
+INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS
+
+#-------------------------------------------------------------------------------
+
+# Database
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(BASE_DIR, 'db.sqlite3'))
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_PATH,
+        # keep connections open between requests of a worker
+        'CONN_MAX_AGE': 600,
+        # seconds the sqlite3 module waits for a lock before "database is locked"
+        'OPTIONS': {'timeout': 20},
+    },
+    # same file, separate query-only connection, see first.db.ReadReplicaRouter
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['first.db.ReadReplicaRouter']
+
+# TEAM_SHARD_COUNT=N moves teams into N more files next to the database, see
+# team.sharding; existing teams have to be moved with dump_teams/load_teams
+TEAM_SHARD_COUNT = int(os.environ.get('TEAM_SHARD_COUNT', 0))
+
+if TEAM_SHARD_COUNT > 1:
+    TEAM_SHARDS = tuple('team_%d' % i for i in range(TEAM_SHARD_COUNT))
+    for alias in TEAM_SHARDS:
+        DATABASES[alias] = dict(
+            DATABASES['default'],
+            NAME=os.path.join(os.path.dirname(DATABASE_PATH), '%s.sqlite3' % alias),
+        )
+    DATABASE_ROUTERS = ['team.sharding.TeamShardRouter'] + DATABASE_ROUTERS
+
+# applied to every new connection by first.db.apply_pragmas
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_READ_ONLY_DATABASES = ('replica',)
@@ -42,6 +42,7 @@ DJANGO_APPS = (
 )
 
 LOCAL_APPS = (
+    'first',
     'team',
 )
 
@@ -51,7 +52,9 @@ DEBUG_APPS = (
 
 INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS
 
-if DEBUG:
+# the toolbar is slow to import and patches settings and URLs, only load it
+# when asked for: DEBUG_TOOLBAR=1 python manage.py runserver
+if DEBUG and os.environ.get('DEBUG_TOOLBAR') == '1':
     INSTALLED_APPS += DEBUG_APPS
 
 #-------------------------------------------------------------------------------
@@ -59,11 +62,13 @@ if DEBUG:
 #AUTH_USER_MODEL = 'auth.User'
 
 MIDDLEWARE_CLASSES = (
+    'first.metrics.QueryMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'team.middleware.MembershipScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -73,6 +78,20 @@ MIDDLEWARE_CLASSES = (
 
 ROOT_URLCONF = 'first.urls'
 
+#-------------------------------------------------------------------------------
+
+# Request metrics (first.metrics), served at /metrics/ in Prometheus format
+
+# share of requests that get their queries recorded
+METRICS_SAMPLE_RATE = 0.05
+
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# when set, each worker writes its totals here and /metrics/ adds them up
+METRICS_DIR = None
+
+METRICS_FLUSH_INTERVAL = 10
+
 WSGI_APPLICATION = 'first.wsgi.application'
 
 #-------------------------------------------------------------------------------
@@ -126,3 +145,100 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.8/howto/static-files/
 
 STATIC_URL = '/static/'
+
+#-------------------------------------------------------------------------------
+
+# Uploaded files
+# https://docs.djangoproject.com/en/1.8/topics/http/file-uploads/
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+MEDIA_URL = '/media/'
+
+# stream every upload to a temporary file instead of buffering it in memory
+FILE_UPLOAD_HANDLERS = (
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+)
+
+#-------------------------------------------------------------------------------
+
+# Team names
+
+# names containing any of these (after case and look-alike folding) are refused
+TEAM_NAME_BLACKLIST = ()
+
+# optional file with one entry per line, picked up without a restart
+TEAM_NAME_BLACKLIST_FILE = None
+
+TEAM_NAME_BLACKLIST_RELOAD_INTERVAL = 5
+
+#-------------------------------------------------------------------------------
+
+# Caches
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # per-process tier of team.cache
+    'team_local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'team',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # tier of team.cache shared by the processes of this host
+    'team_shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'team'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+TEAM_CACHE_LOCAL = 'team_local'
+TEAM_CACHE_SHARED = 'team_shared'
+
+#-------------------------------------------------------------------------------
+
+# Team shards (team.sharding)
+
+# database aliases holding teams, memberships and invitations by team id;
+# empty keeps everything in 'default'. Needs team.sharding.TeamShardRouter
+# first in DATABASE_ROUTERS.
+TEAM_SHARDS = ()
+
+#-------------------------------------------------------------------------------
+
+# Batch authorization endpoint (team_authz), for services on this host
+
+TEAM_AUTHZ_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+#-------------------------------------------------------------------------------
+
+# Invite autocomplete (team.autocomplete)
+
+# seconds between checks for users created by other processes
+TEAM_AUTOCOMPLETE_REFRESH_INTERVAL = 5
+
+# seconds between full rebuilds, which pick up renames and deletions
+TEAM_AUTOCOMPLETE_REBUILD_INTERVAL = 600
+
+#-------------------------------------------------------------------------------
+
+# Team avatars
+
+TEAM_AVATAR_MAX_SIZE = 5 * 1024 * 1024
+
+TEAM_AVATAR_MAX_PIXELS = 40 * 1000 * 1000
+
+TEAM_AVATAR_SIZES = {
+    'small': 64,
+    'medium': 256,
+}
+
+TEAM_AVATAR_WORKERS = 2
+
+# "sync" sends team signals in the request, "async" records them in the
+# outbox for `manage.py drain_team_outbox`
+TEAM_SIGNAL_DISPATCH = 'sync'
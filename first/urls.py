@@ -16,7 +16,10 @@ Including another URLconf
 from django.conf.urls import include, url
 from django.contrib import admin
 
+from . import metrics
+
 urlpatterns = [
     url(r'^team/', include('team.urls')),
     url(r'^admin/', include(admin.site.urls)),
+    url(r'^metrics/$', metrics.metrics_view, name='metrics'),
 ]
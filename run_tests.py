@@ -20,8 +20,14 @@ DEFAULT_SETTINGS = dict(
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": ":memory:",
-        }
+        },
+        # second team shard for team.tests.ShardingTests
+        "team_1": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        },
     },
+    DATABASE_ROUTERS=["team.sharding.TeamShardRouter"],
     MIDDLEWARE_CLASSES=[],
     SITE_ID=1,
     ROOT_URLCONF="team.tests.urls",
@@ -1,3 +1,7 @@
 #!/bin/bash
 
-gunicorn first.wsgi:application
+cd "$(dirname "$0")"
+
+export DJANGO_SETTINGS_MODULE=${DJANGO_SETTINGS_MODULE:-first.production}
+
+exec gunicorn -c config/gunicorn.py first.wsgi:application
@@ -1,15 +1,68 @@
-from django.contrib import admin
+from collections import defaultdict
+
+from django.contrib import admin, messages
 from .models import Team, Membership, Invitation
+from .pagination import EstimatedCountPaginator
+
+
+def _moderate_applicants(modeladmin, request, queryset, method, verb):
+    by_team = defaultdict(list)
+    for pk, team_id in queryset.values_list("pk", "team_id"):
+        by_team[team_id].append(pk)
+
+    applied = total = 0
+    for team in Team.objects.filter(pk__in=list(by_team)):
+        outcomes = getattr(team, method)(by_team[team.pk], request.user)
+        applied += sum(outcomes.values())
+        total += len(outcomes)
+    level = messages.SUCCESS if applied == total else messages.WARNING
+    modeladmin.message_user(
+        request,
+        "%d of %d selected memberships %s. Only applications to teams you "
+        "manage can be moderated." % (applied, total, verb),
+        level,
+    )
+
+def accept_applicants(modeladmin, request, queryset):
+    _moderate_applicants(modeladmin, request, queryset, "accept_applicants", "accepted")
+accept_applicants.short_description = "Accept selected applicants"
+
+def reject_applicants(modeladmin, request, queryset):
+    _moderate_applicants(modeladmin, request, queryset, "reject_applicants", "rejected")
+reject_applicants.short_description = "Reject selected applicants"
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    # changelists must not count or scan the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
-class TeamAdmin(admin.ModelAdmin):
-    pass
+class TeamAdmin(ScalableModelAdmin):
+    list_display = [
+        "name",
+        "creator",
+        "accepted_count",
+        "pending_count",
+        "public_visible",
+        "created_at",
+    ]
+    list_select_related = ["creator"]
+    raw_id_fields = ["creator"]
+    # prefix search on the NOCASE name index (migration 0009)
+    search_fields = ["^name"]
 admin.site.register(Team, TeamAdmin)
 
-class MembershipAdmin(admin.ModelAdmin):
-    pass
+class MembershipAdmin(ScalableModelAdmin):
+    list_display = ["id", "user", "team", "role", "status", "created_at"]
+    list_select_related = ["user", "team"]
+    raw_id_fields = ["user", "team", "invite"]
+    list_filter = ["status", "role"]
+    search_fields = ["^user__username"]
+    actions = [accept_applicants, reject_applicants]
 admin.site.register(Membership, MembershipAdmin)
 
 
-class InvitationAdmin(admin.ModelAdmin):
-    pass
+class InvitationAdmin(ScalableModelAdmin):
+    list_display = ["id", "created_at"]
 admin.site.register(Invitation, InvitationAdmin)
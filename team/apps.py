@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+class TeamConfig(AppConfig):
+
+    name = "team"
+
+    def ready(self):
+        from . import autocomplete, blacklist, schema
+        blacklist.get_blacklist()
+        post_migrate.connect(schema.repair_after_migrate, sender=self)
+        post_save.connect(autocomplete.user_saved, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(autocomplete.user_deleted, sender=settings.AUTH_USER_MODEL)
@@ -0,0 +1,168 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from . import sharding
+from .models import Membership, MembershipStatus
+
+# ------------------------------------------------------------------------------
+# Usernames of active users are kept in a sorted list of (lowercased
+# username, user id) so a prefix lookup is a bisect plus a short walk. Emails
+# are left out on purpose: matching them would let any manager probe whether
+# an address has an account.
+# Saves and deletes in this process update the index through the User signals;
+# users created by other processes are picked up by a ``pk > last seen`` query
+# every TEAM_AUTOCOMPLETE_REFRESH_INTERVAL seconds, everything else by a full
+# rebuild every TEAM_AUTOCOMPLETE_REBUILD_INTERVAL seconds.
+
+EXCLUDED_STATUSES = MembershipStatus.ACCEPTED_STATUSES + (MembershipStatus.INVITED,)
+
+
+class UserIndex(object):
+
+    def __init__(self, rows=()):
+        self.keys = []
+        self.users = {}
+        self.max_pk = 0
+        for pk, username in rows:
+            self.users[pk] = username
+            self.keys.append((username.lower(), pk))
+            self.max_pk = max(self.max_pk, pk)
+        self.keys.sort()
+
+    def add(self, pk, username):
+        self.remove(pk)
+        self.users[pk] = username
+        insort(self.keys, (username.lower(), pk))
+        self.max_pk = max(self.max_pk, pk)
+
+    def remove(self, pk):
+        username = self.users.pop(pk, None)
+        if username is None:
+            return
+        key = (username.lower(), pk)
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def prefixed(self, prefix):
+        """
+        Yields ``(pk, username)`` of the users with a username starting with
+        ``prefix``, in key order.
+        """
+        prefix = prefix.lower()
+        position = bisect_left(self.keys, (prefix,))
+        while position < len(self.keys):
+            key, pk = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            if pk in self.users:
+                yield pk, self.users[pk]
+            position += 1
+
+# ------------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_index = None
+_journal = None
+_refreshed_at = 0
+_rebuilt_at = 0
+
+
+def _active_users():
+    return get_user_model()._default_manager.filter(is_active=True)
+
+
+def _rows(queryset):
+    username = get_user_model().USERNAME_FIELD
+    return queryset.values_list("pk", username).iterator()
+
+
+def rebuild():
+    """
+    Builds a new index from the database and swaps it in. Changes recorded
+    by the User signals while it was being built are replayed onto it.
+    """
+    global _index, _journal, _refreshed_at, _rebuilt_at
+    with _lock:
+        _journal = []
+    started = time.time()
+    index = UserIndex(_rows(_active_users()))
+    with _lock:
+        for method, args in _journal:
+            getattr(index, method)(*args)
+        _index, _journal = index, None
+        _refreshed_at = _rebuilt_at = started
+    return index
+
+
+def get_index():
+    global _refreshed_at, _rebuilt_at
+    if _index is None:
+        return rebuild()
+    now = time.time()
+    rebuild_interval = getattr(settings, "TEAM_AUTOCOMPLETE_REBUILD_INTERVAL", 600)
+    refresh_interval = getattr(settings, "TEAM_AUTOCOMPLETE_REFRESH_INTERVAL", 5)
+    if now - _rebuilt_at > rebuild_interval and _journal is None:
+        _rebuilt_at = now
+        thread = threading.Thread(target=rebuild, name="team-autocomplete-rebuild")
+        thread.daemon = True
+        thread.start()
+    elif now - _refreshed_at > refresh_interval:
+        _refreshed_at = now
+        for row in _rows(_active_users().filter(pk__gt=_index.max_pk)):
+            _apply("add", *row)
+    return _index
+
+
+def _apply(method, *args):
+    with _lock:
+        if _index is not None:
+            getattr(_index, method)(*args)
+        if _journal is not None:
+            _journal.append((method, args))
+
+
+def user_saved(sender, instance, **kwargs):
+    if instance.is_active:
+        _apply("add", instance.pk, instance.get_username())
+    else:
+        _apply("remove", instance.pk)
+
+
+def user_deleted(sender, instance, **kwargs):
+    _apply("remove", instance.pk)
+
+# ------------------------------------------------------------------------------
+
+def users_to_invite(team, prefix, limit=10, batch_size=50):
+    """
+    Returns up to ``limit`` ``(pk, username)`` pairs of users matching
+    ``prefix`` who are neither on ``team`` nor invited to it. Candidates are
+    checked against the team's memberships ``batch_size`` at a time.
+    """
+    results = []
+    if not prefix:
+        return results
+    candidates = get_index().prefixed(prefix)
+    while len(results) < limit:
+        batch = []
+        with _lock:
+            for candidate in candidates:
+                batch.append(candidate)
+                if len(batch) == batch_size:
+                    break
+        if not batch:
+            break
+        excluded = set(Membership.objects.using(sharding.shard_for(team.pk)).filter(
+            team=team,
+            user__in=[pk for pk, username in batch],
+            status__in=EXCLUDED_STATUSES,
+        ).values_list("user_id", flat=True))
+        results.extend(
+            candidate for candidate in batch if candidate[0] not in excluded
+        )
+    return results[:limit]
@@ -0,0 +1,120 @@
+import io
+import json
+import logging
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Avatar thumbnails are rendered off the request path by a small pool of
+# worker threads. The pool is created lazily so that it is started in each
+# (forked) worker process rather than in the master.
+
+DEFAULT_SIZES = {"small": 64, "medium": 256}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, "TEAM_AVATAR_SIZES", DEFAULT_SIZES)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(getattr(settings, "TEAM_AVATAR_WORKERS", 2))
+    return _pool
+
+
+def schedule(team):
+    if team.avatar:
+        get_pool().apply_async(_process_in_pool, (team.pk, team.avatar.name))
+
+
+def _process_in_pool(team_id, name):
+    try:
+        return process_avatar(team_id, name)
+    finally:
+        # pool threads open their own connections and never see
+        # request_finished; callers in other threads keep theirs
+        for connection in connections.all():
+            connection.close()
+
+
+def process_avatar(team_id, name):
+    """
+    Renders the variants of the avatar ``name`` and records them on the team,
+    unless the team's avatar has been replaced in the meantime.
+    """
+    from . import sharding
+    from .models import Team
+
+    using = sharding.shard_for(team_id)
+    try:
+        storage = Team._meta.get_field("avatar").storage
+        variants = render_variants(storage, name)
+        Team.objects.using(using).filter(pk=team_id, avatar=name).update(
+            avatar_variants=json.dumps(variants, sort_keys=True)
+        )
+        return variants
+    except Exception:
+        logger.exception("Failed to process avatar %s of team %s", name, team_id)
+
+
+def output_format():
+    from PIL import Image
+
+    Image.init()
+    if "WEBP" in Image.SAVE:
+        return "WEBP", "webp"
+    return "JPEG", "jpg"
+
+
+def render_variants(storage, name):
+    """
+    Writes a square thumbnail per configured size next to ``name`` and
+    returns ``{variant: storage name}``. Metadata is not carried over.
+    """
+    from PIL import Image, ImageOps
+
+    sizes = get_sizes()
+    fmt, ext = output_format()
+    max_pixels = getattr(settings, "TEAM_AVATAR_MAX_PIXELS", 40 * 1000 * 1000)
+
+    with storage.open(name) as fp:
+        image = Image.open(fp)
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ValueError("avatar %s is %dx%d pixels" % (name, width, height))
+        # lets the JPEG decoder scale down while decoding
+        largest = max(sizes.values())
+        image.draft("RGB", (largest, largest))
+        image.load()
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    if image.mode == "RGBA" and fmt == "JPEG":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+
+    base = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    for variant, size in sorted(sizes.items()):
+        thumbnail = ImageOps.fit(image, (size, size), Image.ANTIALIAS)
+        thumbnail.info = {}
+        buf = io.BytesIO()
+        thumbnail.save(buf, fmt, quality=85)
+        variants[variant] = storage.save(
+            os.path.join("avatars", "variants", "%s-%d.%s" % (base, size, ext)),
+            ContentFile(buf.getvalue()),
+        )
+    return variants
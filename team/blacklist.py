@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+
+from django.conf import settings
+from django.utils.encoding import force_text
+
+# ------------------------------------------------------------------------------
+# Team names are compared in a normalized form: NFKC, casefolded, common
+# look-alike characters folded to ASCII, accents and punctuation dropped.
+
+CONFUSABLES = {
+    u"0": u"o", u"1": u"i", u"3": u"e", u"4": u"a", u"5": u"s", u"7": u"t",
+    u"@": u"a", u"$": u"s", u"!": u"i", u"|": u"l",
+    # Cyrillic
+    u"а": u"a", u"е": u"e", u"о": u"o", u"р": u"p",
+    u"с": u"c", u"у": u"y", u"х": u"x", u"і": u"i",
+    u"ј": u"j", u"ѕ": u"s", u"к": u"k", u"м": u"m",
+    u"т": u"t", u"н": u"h", u"в": u"b",
+    # Greek
+    u"α": u"a", u"ε": u"e", u"ι": u"i", u"κ": u"k",
+    u"ν": u"v", u"ο": u"o", u"ρ": u"p", u"τ": u"t",
+    u"υ": u"u", u"χ": u"x",
+}
+
+
+def normalize(value):
+    value = unicodedata.normalize("NFKC", force_text(value))
+    value = getattr(value, "casefold", value.lower)()
+    value = u"".join(CONFUSABLES.get(c, c) for c in value)
+    value = unicodedata.normalize("NFKD", value)
+    return u"".join(c for c in value if c.isalnum() and not unicodedata.combining(c))
+
+
+class NameBlacklist(object):
+    """
+    A compiled blacklist: the normalized entries as a frozenset plus an
+    Aho-Corasick automaton that finds any of them inside a normalized name in
+    a single pass over the name.
+    """
+
+    def __init__(self, entries):
+        self.entries = frozenset(e for e in (normalize(e) for e in entries) if e)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [False]
+        for entry in self.entries:
+            self._add(entry)
+        self._link()
+
+    def _add(self, entry):
+        node = 0
+        for char in entry:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(False)
+                self._goto[node][char] = child
+            node = child
+        self._out[node] = True
+
+    def _link(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                out[child] = out[child] or out[fail[child]]
+                queue.append(child)
+
+    def matches(self, name):
+        text = normalize(name)
+        if text in self.entries:
+            return True
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                return True
+        return False
+
+    __contains__ = matches
+
+# ------------------------------------------------------------------------------
+# The compiled blacklist is shared by the process. When TEAM_NAME_BLACKLIST_FILE
+# is set, its mtime is checked at most every TEAM_NAME_BLACKLIST_RELOAD_INTERVAL
+# seconds and a changed file is compiled in a background thread; the previous
+# blacklist stays in use until the new one is ready.
+
+_lock = threading.Lock()
+_blacklist = None
+_mtime = None
+_checked_at = 0
+_reloading = False
+
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _read_entries(path):
+    entries = list(getattr(settings, "TEAM_NAME_BLACKLIST", ()))
+    if path and os.path.exists(path):
+        with open(path, "rb") as fp:
+            for line in fp:
+                line = line.decode("utf-8").strip()
+                if line and not line.startswith("#"):
+                    entries.append(line)
+    return entries
+
+
+def reload():
+    global _blacklist, _mtime, _reloading
+    path = getattr(settings, "TEAM_NAME_BLACKLIST_FILE", None)
+    mtime = _file_mtime(path) if path else None
+    try:
+        blacklist = NameBlacklist(_read_entries(path))
+        with _lock:
+            _blacklist, _mtime = blacklist, mtime
+    finally:
+        _reloading = False
+    return blacklist
+
+
+def get_blacklist():
+    global _checked_at, _reloading
+    blacklist = _blacklist
+    if blacklist is None:
+        return reload()
+
+    path = getattr(settings, "TEAM_NAME_BLACKLIST_FILE", None)
+    interval = getattr(settings, "TEAM_NAME_BLACKLIST_RELOAD_INTERVAL", 5)
+    now = time.time()
+    if path and now - _checked_at > interval:
+        with _lock:
+            _checked_at = now
+            changed = not _reloading and _file_mtime(path) != _mtime
+            if changed:
+                _reloading = True
+        if changed:
+            thread = threading.Thread(target=reload, name="team-blacklist-reload")
+            thread.daemon = True
+            thread.start()
+    return blacklist
@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+# ------------------------------------------------------------------------------
+# Per-team data is cached under the team's current version, so bumping the
+# version invalidates everything cached for the team at once. There are two
+# tiers: a local-memory cache in every process (TEAM_CACHE_LOCAL) in front of
+# a file-based cache shared by the processes on the host (TEAM_CACHE_SHARED).
+# Versions are only kept in the shared tier, which makes a bump visible to
+# all processes; local entries are never stale because the version is part
+# of their key.
+
+# how long a process waits for another one to finish computing a value
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+# threads of a process computing the same key wait for each other
+_stripes = [threading.Lock() for i in range(64)]
+
+
+def _local():
+    return caches[getattr(settings, "TEAM_CACHE_LOCAL", "default")]
+
+
+def _shared():
+    return caches[getattr(settings, "TEAM_CACHE_SHARED", "default")]
+
+
+def _version_key(team_id):
+    return "team:%s:version" % team_id
+
+
+def get_version(team_id):
+    shared = _shared()
+    version = shared.get(_version_key(team_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not shared.add(_version_key(team_id), version, None):
+            version = shared.get(_version_key(team_id), version)
+    return version
+
+
+def bump(team_id):
+    # a fresh token rather than an increment: the file-based cache has no
+    # atomic incr and two racing bumps must not end on the same version
+    _shared().set(_version_key(team_id), uuid.uuid4().hex, None)
+
+
+def get_or_compute(team_id, name, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the value cached as ``name`` for the team's current version,
+    calling ``compute`` on a miss. Only one thread per process and, as far
+    as the shared cache's ``add`` allows, one process computes a missing
+    value; the others wait for its result.
+    """
+    key = "team:%s:%s:%s" % (team_id, get_version(team_id), name)
+    local = _local()
+    value = local.get(key)
+    if value is None:
+        with _stripes[hash(key) % len(_stripes)]:
+            value = local.get(key)
+            if value is None:
+                value = _get_or_compute_shared(key, compute, timeout)
+                local.set(key, value, timeout)
+    return value
+
+
+def _get_or_compute_shared(key, compute, timeout):
+    shared = _shared()
+    value = shared.get(key)
+    if value is not None:
+        return value
+
+    lock_key = key + ":lock"
+    deadline = time.time() + LOCK_TIMEOUT
+    locked = shared.add(lock_key, 1, LOCK_TIMEOUT)
+    while not locked and time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = shared.get(key)
+        if value is not None:
+            return value
+        locked = shared.add(lock_key, 1, LOCK_TIMEOUT)
+    try:
+        value = compute()
+        shared.set(key, value, timeout)
+    finally:
+        if locked:
+            shared.delete(lock_key)
+    return value
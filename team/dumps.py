@@ -0,0 +1,196 @@
+import datetime
+import json
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+
+from . import cache, search, sharding
+from .models import Invitation, Membership, Team
+
+# ------------------------------------------------------------------------------
+# Dumps are NDJSON: a header line, then for every model a line naming it and
+# its columns followed by one JSON array per row. Models are written in
+# foreign key order, so a dump can be loaded front to back.
+
+FORMAT = {"format": "team-dump", "version": 1}
+
+MODELS = [Invitation, Team, Membership]
+
+
+class DumpEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder cuts datetimes and times to milliseconds; a dump has
+    to restore them exactly.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(DumpEncoder, self).default(o)
+
+
+def _label(model):
+    return "%s.%s" % (model._meta.app_label, model._meta.model_name)
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def dump(write, chunk_size=5000, using="default"):
+    """
+    Passes the dump line by line to ``write``. Rows are read in primary key
+    chunks, so memory does not grow with the table. Returns the row count
+    per model label.
+    """
+    counts = {}
+    write(json.dumps(FORMAT) + "\n")
+    for model in MODELS:
+        columns = _columns(model)
+        write(json.dumps({"model": _label(model), "fields": columns}) + "\n")
+        rows = model._base_manager.using(using).order_by("pk").values_list(*columns)
+        pk_index = columns.index(model._meta.pk.attname)
+        count, last_pk = 0, None
+        while True:
+            chunk = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            chunk = list(chunk[:chunk_size])
+            for row in chunk:
+                write(json.dumps(row, cls=DumpEncoder) + "\n")
+            count += len(chunk)
+            if len(chunk) < chunk_size:
+                break
+            last_pk = chunk[-1][pk_index]
+        counts[_label(model)] = count
+    return counts
+
+# how many missing user ids a failed load names
+MAX_REPORTED_USERS = 20
+
+# ------------------------------------------------------------------------------
+
+def _sqlite_indexes(connection, tables):
+    # explicit indexes only; the ones backing UNIQUE constraints have no sql
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+            "AND sql IS NOT NULL AND tbl_name IN (%s)" % ", ".join(["%s"] * len(tables)),
+            tables,
+        )
+        return cursor.fetchall()
+
+
+def _insert(model, fields, rows, using):
+    # rows go in as they were dumped: raw inserts skip pre_save, which would
+    # otherwise replace every auto_now_add timestamp with the current time
+    Row = namedtuple("Row", [field.attname for field in fields])
+    objs = [Row._make(row) for row in rows]
+    batch_size = connections[using].ops.bulk_batch_size(fields, objs) or len(objs)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(
+            objs[start:start + batch_size], fields=fields, using=using, raw=True
+        )
+
+
+def load(lines, chunk_size=5000, replace=False, using="default"):
+    """
+    Loads a dump from an iterable of lines in one transaction. On SQLite the
+    indexes of the team tables and the search index are dropped while rows
+    are inserted and rebuilt at the end. Raises ``ValueError``, loading
+    nothing, when the dump is malformed or refers to users that do not
+    exist. Returns the row count per label.
+    """
+    connection = connections[using]
+    models = dict((_label(model), model) for model in MODELS)
+    tables = [model._meta.db_table for model in MODELS]
+    User = get_user_model()
+    counts = {}
+    # teams whose cached data is outdated afterwards, and the users referred to
+    team_ids, user_ids = set(), set()
+
+    with transaction.atomic(using=using):
+        for model in reversed(MODELS):
+            if model._base_manager.using(using).exists():
+                if not replace:
+                    raise ValueError("%s is not empty" % _label(model))
+                if model is Team:
+                    team_ids.update(Team._base_manager.using(using).values_list("pk", flat=True))
+                with connection.cursor() as cursor:
+                    cursor.execute("DELETE FROM %s" % connection.ops.quote_name(model._meta.db_table))
+
+        indexes, searchable = [], False
+        if connection.vendor == "sqlite":
+            indexes = _sqlite_indexes(connection, tables)
+            searchable = search.is_installed(connection)
+            if searchable:
+                search.uninstall(connection)
+            with connection.cursor() as cursor:
+                for name, sql in indexes:
+                    cursor.execute("DROP INDEX %s" % connection.ops.quote_name(name))
+
+        lines = iter(lines)
+        header = next(lines, None)
+        if header is None:
+            raise ValueError("empty dump")
+        header = json.loads(header)
+        if header != FORMAT:
+            raise ValueError("not a team dump: %r" % header)
+        model, fields, chunk = None, None, []
+        for line in lines:
+            value = json.loads(line)
+            if isinstance(value, dict):
+                if chunk:
+                    _insert(model, fields, chunk, using)
+                if value.get("model") not in models:
+                    raise ValueError("unknown model: %r" % value.get("model"))
+                model = models[value["model"]]
+                by_attname = dict((f.attname, f) for f in model._meta.concrete_fields)
+                try:
+                    fields = [by_attname[column] for column in value["fields"]]
+                except KeyError as e:
+                    raise ValueError("unknown %s field: %s" % (value["model"], e))
+                team_column = None
+                if model is Team and Team._meta.pk in fields:
+                    team_column = fields.index(Team._meta.pk)
+                user_columns = [
+                    i for i, field in enumerate(fields) if field.related_model is User
+                ]
+                chunk = []
+                counts[value["model"]] = 0
+                continue
+            if model is None:
+                raise ValueError("row before any model line")
+            chunk.append(value)
+            counts[_label(model)] += 1
+            if team_column is not None:
+                team_ids.add(value[team_column])
+            user_ids.update(value[i] for i in user_columns if value[i] is not None)
+            if len(chunk) >= chunk_size:
+                _insert(model, fields, chunk, using)
+                chunk = []
+        if chunk:
+            _insert(model, fields, chunk, using)
+
+        # users may live on another database, nothing checked these
+        missing = sorted(user_ids.difference(sharding.usernames(user_ids)))
+        if missing:
+            raise ValueError("%d users do not exist, ids %s" % (
+                len(missing), ", ".join(str(pk) for pk in missing[:MAX_REPORTED_USERS])
+            ))
+
+        with connection.cursor() as cursor:
+            for name, sql in indexes:
+                cursor.execute(sql)
+            for sql in connection.ops.sequence_reset_sql(no_style(), MODELS):
+                cursor.execute(sql)
+        if searchable:
+            search.install(connection)
+
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    for team_id in team_ids:
+        cache.bump(team_id)
+    return counts
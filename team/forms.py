@@ -2,14 +2,30 @@ from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 
+from django.template.defaultfilters import filesizeformat
+
+from .blacklist import get_blacklist
 from .models import Team, Membership
 
+class AvatarField(forms.ImageField):
+
+    def to_python(self, data):
+        # reject oversized uploads before Pillow gets to look at them
+        max_size = getattr(settings, "TEAM_AVATAR_MAX_SIZE", 5 * 1024 * 1024)
+        if data is not None and data.size > max_size:
+            raise forms.ValidationError(
+                _("Avatar images may not be larger than %s") % filesizeformat(max_size)
+            )
+        return super(AvatarField, self).to_python(data)
+
 class TeamForm(forms.ModelForm):
 
+    avatar = AvatarField(required=False)
+
     def clean_name(self):
         # if self.instance.pk is None and Team.objects.filter(slug=slug).exists():
         #     raise forms.ValidationError(_("Team with this name already exists"))
-        if self.cleaned_data["name"].lower() in settings.TEAM_NAME_BLACKLIST:
+        if get_blacklist().matches(self.cleaned_data["name"]):
             raise forms.ValidationError(_("You can not create a team by this name"))
         return self.cleaned_data["name"]
 
@@ -0,0 +1,43 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from team import sharding
+from team.models import Team, avatar_storage
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Deletes avatar files that no team references any more. Files younger "
+        "than --grace seconds are kept so uploads in flight are not collected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace", type=int, default=3600)
+        parser.add_argument("--dry-run", action="store_true", default=False)
+
+    def handle(self, *args, **options):
+        refcounts = Counter()
+        for using in sharding.shards():
+            teams = Team.objects.using(using).exclude(avatar="").only(
+                "avatar", "avatar_variants"
+            )
+            for team in teams.iterator():
+                refcounts.update(team.get_avatar_names())
+
+        cutoff = time.time() - options["grace"]
+        kept = deleted = 0
+        for name, mtime in avatar_storage.blobs("avatars"):
+            if refcounts[name] or mtime > cutoff:
+                kept += 1
+                continue
+            if not options["dry_run"]:
+                avatar_storage.delete(name)
+            deleted += 1
+
+        self.stdout.write("%s %d unreferenced avatar files, kept %d (%d references)." % (
+            "Would delete" if options["dry_run"] else "Deleted",
+            deleted, kept, sum(refcounts.values()),
+        ))
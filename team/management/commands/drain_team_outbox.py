@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from team import outbox, sharding
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Delivers team signals recorded while TEAM_SIGNAL_DISPATCH is "
+        "\"async\", from every team shard. Run a single instance per "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="seconds to sleep when the outbox is empty")
+        parser.add_argument("--once", action="store_true", default=False,
+                            help="exit once the outbox is drained")
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+        while True:
+            counts = [0, 0, 0]
+            for using in sharding.shards():
+                drained = outbox.drain(
+                    options["batch_size"], options["max_attempts"], using=using
+                )
+                counts = [count + more for count, more in zip(counts, drained)]
+            counts = tuple(counts)
+            totals = [total + count for total, count in zip(totals, counts)]
+            if int(options["verbosity"]) > 1 and any(counts):
+                self.stdout.write("delivered %d, retrying %d, failed %d" % counts)
+            if not any(counts):
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+
+        self.stdout.write("Delivered %d events, %d retries, %d failed." % tuple(totals))
@@ -0,0 +1,43 @@
+import gzip
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from team import dumps
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Writes teams, invitations and memberships to a gzip-compressed "
+        "NDJSON dump ('-' for stdout) that load_teams can restore."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--database", default="default",
+                            help="database to dump, one team shard at a time")
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            raw = gzip.GzipFile(fileobj=getattr(sys.stdout, "buffer", sys.stdout), mode="wb")
+        else:
+            raw = gzip.open(options["path"], "wb")
+        started = time.time()
+        with raw:
+            stream = io.BufferedWriter(raw, 1 << 16)
+            counts = dumps.dump(
+                lambda line: stream.write(line.encode("utf-8")),
+                chunk_size=options["chunk_size"],
+                using=options["database"],
+            )
+            stream.flush()
+        elapsed = time.time() - started
+
+        if options["path"] != "-":
+            for label, count in sorted(counts.items()):
+                self.stdout.write("Dumped %d %s rows." % (count, label))
+            self.stdout.write("Done in %.1f s." % elapsed)
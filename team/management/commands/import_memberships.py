@@ -0,0 +1,148 @@
+import csv
+import json
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from team import sharding
+from team.models import Team, Membership
+
+
+ROLES = dict((label, value) for value, label in Membership.ROLE_CHOICES)
+
+USER_KEYS = ["user_id", "username", "email"]
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Invites the users listed in a CSV or JSON lines file to a team. "
+        "Rows identify users by a user_id, username or email column."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("team_id", type=int)
+        parser.add_argument("path", help="file to import, '-' for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+        parser.add_argument("--role", choices=sorted(ROLES), default="member")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            team = Team.objects.using(
+                sharding.shard_for(options["team_id"])
+            ).get(pk=options["team_id"])
+        except Team.DoesNotExist:
+            raise CommandError("Team %s does not exist" % options["team_id"])
+
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "csv" if path.endswith(".csv") else "jsonl"
+
+        stream = sys.stdin if path == "-" else open(path)
+        try:
+            self.import_rows(team, self.read_rows(stream, fmt), options)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def read_rows(self, stream, fmt):
+        if fmt == "csv":
+            for row in csv.DictReader(stream):
+                yield row
+        else:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def import_rows(self, team, rows, options):
+        role = ROLES[options["role"]]
+        chunk_size = options["chunk_size"]
+        started = time.time()
+        total = added = matched = malformed = 0
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                chunk_added, chunk_matched, chunk_malformed = self.import_chunk(
+                    team, chunk, role, total
+                )
+                total += len(chunk)
+                added += chunk_added
+                matched += chunk_matched
+                malformed += chunk_malformed
+                chunk = []
+        if chunk:
+            chunk_added, chunk_matched, chunk_malformed = self.import_chunk(
+                team, chunk, role, total
+            )
+            total += len(chunk)
+            added += chunk_added
+            matched += chunk_matched
+            malformed += chunk_malformed
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stdout.write(
+            "Read %d rows in %.2fs (%.0f rows/s): added %d, skipped %d existing, "
+            "%d unmatched, %d malformed rows." % (
+                total, elapsed, total / elapsed, added,
+                matched - added, total - matched - malformed, malformed,
+            )
+        )
+
+    def row_key(self, row):
+        """
+        Returns the ``(column, value)`` identifying the row's user, or None.
+        Raises ValueError for a user_id that is not a number.
+        """
+        for key in USER_KEYS:
+            if row.get(key):
+                if key == "user_id":
+                    return key, int(row[key])
+                return key, row[key]
+        return None
+
+    def import_chunk(self, team, rows, role, offset=0):
+        """
+        Invites the users the rows identify, each row matching at most one
+        user. Returns how many memberships were created, how many rows
+        matched a user and how many were malformed.
+        """
+        keys, malformed = [], 0
+        for number, row in enumerate(rows, offset + 1):
+            try:
+                keys.append(self.row_key(row))
+            except (TypeError, ValueError):
+                self.stderr.write(
+                    "Row %d: invalid user_id %r, skipped." % (number, row["user_id"])
+                )
+                keys.append(None)
+                malformed += 1
+
+        wanted = dict((key, set()) for key in USER_KEYS)
+        for key in keys:
+            if key is not None:
+                wanted[key[0]].add(key[1])
+
+        User = get_user_model()
+        found = dict((key, {}) for key in USER_KEYS)
+        for key, values in wanted.items():
+            if values:
+                field = "pk" if key == "user_id" else key
+                for pk, value in User.objects.filter(
+                    **{"%s__in" % field: values}
+                ).values_list("pk", field):
+                    found[key].setdefault(value, []).append(pk)
+
+        # an email shared by several users does not say whom to invite
+        user_ids = [
+            found[key[0]][key[1]][0] for key in keys
+            if key is not None and len(found[key[0]].get(key[1], ())) == 1
+        ]
+        created = team.add_users(set(user_ids), role, chunk_size=len(rows))
+        return len(created), len(user_ids), malformed
@@ -0,0 +1,47 @@
+import gzip
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from team import dumps
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Restores a dump written by dump_teams ('-' for stdin). The users "
+        "it refers to must already exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--database", default="default",
+                            help="database to load into, one team shard at a time")
+        parser.add_argument("--replace", action="store_true", default=False,
+                            help="delete the existing teams first")
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            raw = gzip.GzipFile(fileobj=getattr(sys.stdin, "buffer", sys.stdin), mode="rb")
+        else:
+            raw = gzip.open(options["path"], "rb")
+        started = time.time()
+        with io.TextIOWrapper(raw, encoding="utf-8") as lines:
+            try:
+                counts = dumps.load(
+                    lines,
+                    chunk_size=options["chunk_size"],
+                    replace=options["replace"],
+                    using=options["database"],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+        elapsed = time.time() - started
+
+        for label, count in sorted(counts.items()):
+            self.stdout.write("Loaded %d %s rows." % (count, label))
+        total = sum(counts.values())
+        self.stdout.write("Done in %.1f s (%d rows/s)." % (elapsed, total / max(elapsed, 0.001)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from team import avatars, sharding
+from team.models import Team
+
+
+class Command(BaseCommand):
+
+    help = "Renders the missing avatar variants of teams."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", default=False,
+                            help="re-render variants that already exist")
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for using in sharding.shards():
+            teams = Team.objects.using(using).exclude(avatar="")
+            if not options["all"]:
+                teams = teams.filter(avatar_variants="")
+            for team_id, name in teams.values_list("pk", "avatar").iterator():
+                if avatars.process_avatar(team_id, name) is None:
+                    failed += 1
+                else:
+                    processed += 1
+        self.stdout.write("Processed %d avatars, %d failed." % (processed, failed))
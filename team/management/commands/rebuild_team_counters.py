@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from team import sharding
+from team.models import Team
+
+
+class Command(BaseCommand):
+
+    help = "Recomputes the denormalized membership counters on Team."
+
+    def add_arguments(self, parser):
+        parser.add_argument("team_ids", nargs="*", type=int)
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+        for using in sharding.shards():
+            teams = Team.objects.using(using).order_by("pk")
+            if options["team_ids"]:
+                teams = teams.filter(pk__in=options["team_ids"])
+
+            last_pk = 0
+            while True:
+                chunk = list(teams.filter(pk__gt=last_pk).values_list(
+                    "pk", flat=True
+                )[:options["chunk_size"]])
+                if not chunk:
+                    break
+                # one transaction per chunk, the cache is bumped after it
+                drifted += Team.objects.using(using).filter(
+                    pk__in=chunk
+                ).rebuild_counters()
+                checked += len(chunk)
+                last_pk = chunk[-1]
+
+        self.stdout.write("Checked %d teams, repaired %d." % (checked, drifted))
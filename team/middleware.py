@@ -0,0 +1,14 @@
+from . import resolver
+
+
+class MembershipScopeMiddleware(object):
+    """
+    Caches membership lookups for the duration of a request.
+    """
+
+    def process_request(self, request):
+        resolver.activate()
+
+    def process_response(self, request, response):
+        resolver.deactivate()
+        return response
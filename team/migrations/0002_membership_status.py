@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membership',
+            name='status',
+            field=models.IntegerField(default=0, choices=[(0, b'applied'), (1, b'invited'), (2, b'declined'), (3, b'rejected'), (4, b'accepted'), (5, b'auto joined')]),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Frozen copies of team.models.counter_deltas() and its tables as of this
+# migration; the migration must not change with the live models.
+STATUS_COUNTERS = {
+    0: "applied_count",    # applied
+    1: "invited_count",    # invited
+    2: "declined_count",   # declined
+    3: "rejected_count",   # rejected
+    4: "accepted_count",   # accepted
+    5: "accepted_count",   # auto joined
+}
+
+ROLE_COUNTERS = {
+    0: "member_count",
+    1: "manager_count",
+    2: "owner_count",
+}
+
+ACCEPTED_STATUSES = (4, 5)
+
+COUNTER_FIELDS = sorted(set(STATUS_COUNTERS.values()) | set(ROLE_COUNTERS.values()))
+
+
+def populate_counters(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Team = apps.get_model("team", "Team")
+    Membership = apps.get_model("team", "Membership")
+    rows = Membership.objects.using(alias).values_list("team_id", "status", "role").annotate(
+        count=models.Count("pk")
+    ).order_by("team_id")
+    counters = {}
+    for team_id, status, role, count in rows:
+        team_counters = counters.setdefault(team_id, dict.fromkeys(COUNTER_FIELDS, 0))
+        team_counters[STATUS_COUNTERS[status]] += count
+        if status in ACCEPTED_STATUSES:
+            team_counters[ROLE_COUNTERS[role]] += count
+    for team_id, team_counters in counters.items():
+        Team.objects.using(alias).filter(pk=team_id).update(**team_counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0002_membership_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='accepted_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='applied_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='declined_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='invited_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='manager_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='member_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='owner_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='rejected_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
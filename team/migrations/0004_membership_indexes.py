@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0003_team_counters'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='membership',
+            index_together=set([('team', 'status', 'role', 'user'), ('user', 'status')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0004_membership_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='team',
+            index_together=set([('created_at', 'id')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0005_team_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='avatar_variants',
+            field=models.TextField(editable=False, blank=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import team.models
+import team.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0006_team_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='avatar',
+            field=models.ImageField(storage=team.storage.ContentAddressedStorage(), upload_to=team.models.avatar_upload, blank=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, router
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+
+# Django implements istartswith as LIKE on SQLite and UPPER(...) LIKE on
+# PostgreSQL; neither can use a plain index, so the admin search fields get
+# matching case-insensitive ones.
+PREFIX_INDEXES = {
+    "sqlite": "CREATE INDEX {name} ON {table} ({column} COLLATE NOCASE)",
+    "postgresql": "CREATE INDEX {name} ON {table} (UPPER({column}::text) text_pattern_ops)",
+}
+
+
+def _prefix_indexes(apps, alias):
+    # team shards (team.sharding) hold the team tables but not the users
+    Team = apps.get_model("team", "Team")
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    # historical models lose class attributes such as USERNAME_FIELD
+    username = get_user_model().USERNAME_FIELD
+    return [
+        (name, model._meta.db_table, column)
+        for name, model, column in [
+            ("team_team_name_prefix", Team, "name"),
+            ("team_user_username_prefix", User, username),
+        ]
+        if router.allow_migrate_model(alias, model)
+    ]
+
+
+def create_prefix_indexes(apps, schema_editor):
+    sql = PREFIX_INDEXES.get(schema_editor.connection.vendor)
+    if sql is None:
+        return
+    quote = schema_editor.quote_name
+    for name, table, column in _prefix_indexes(apps, schema_editor.connection.alias):
+        schema_editor.execute(sql.format(
+            name=quote(name), table=quote(table), column=quote(column)
+        ))
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in PREFIX_INDEXES:
+        return
+    for name, table, column in _prefix_indexes(apps, schema_editor.connection.alias):
+        schema_editor.execute("DROP INDEX %s" % schema_editor.quote_name(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('team', '0008_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='membership',
+            index_together=set([('team', 'status', 'role', 'user'), ('user', 'status'), ('status', 'role')]),
+        ),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import DatabaseError, migrations, transaction
+
+
+# The full-text index is only created on SQLite builds with FTS5;
+# team.search falls back to LIKE queries everywhere else. The statements are
+# a copy of team.search as of this migration, so that later changes there do
+# not change what this migration does.
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE team_team_fts USING fts5("
+    "name, description, content='team_team', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER team_team_fts_insert AFTER INSERT ON team_team BEGIN "
+    "INSERT INTO team_team_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER team_team_fts_delete AFTER DELETE ON team_team BEGIN "
+    "INSERT INTO team_team_fts(team_team_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER team_team_fts_update AFTER UPDATE ON team_team "
+    "WHEN old.name IS NOT new.name OR old.description IS NOT new.description BEGIN "
+    "INSERT INTO team_team_fts(team_team_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO team_team_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "INSERT INTO team_team_fts(team_team_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS team_team_fts_insert",
+    "DROP TRIGGER IF EXISTS team_team_fts_delete",
+    "DROP TRIGGER IF EXISTS team_team_fts_update",
+    "DROP TABLE IF EXISTS team_team_fts",
+]
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            _execute(connection, CREATE_SQL)
+    except DatabaseError:
+        # no FTS5 in this SQLite build
+        pass
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        _execute(schema_editor.connection, DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0009_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Start the sequence after the existing teams, so that ids allocated once
+# teams are sharded never collide with theirs.
+
+def seed_sequence(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Team = apps.get_model('team', 'Team')
+    TeamSequence = apps.get_model('team', 'TeamSequence')
+    last = Team.objects.using(alias).order_by('-pk').values_list('pk', flat=True).first()
+    if last is not None:
+        TeamSequence.objects.using(alias).create(pk=last)
+        TeamSequence.objects.using(alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0010_team_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamSequence',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+            ],
+        ),
+        migrations.RunPython(seed_sequence, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,16 @@
-from django.db import models
+from django.core.urlresolvers import reverse
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 
-from . import signals
+from . import cache, sharding, signals
+from .pagination import decode_cursor
+from .storage import ContentAddressedStorage
+from .resolver import get_resolver, invalidate, membership_changed
 
+from collections import OrderedDict, defaultdict, namedtuple
+from itertools import chain
+import json
 import uuid
 import os
 
@@ -14,9 +21,151 @@ def avatar_upload(instance, filename):
     filename = "%s.%s" % (uuid.uuid4(), ext)
     return os.path.join("avatars", filename)
 
+avatar_storage = ContentAddressedStorage()
+
+# one row of Team.roster()
+RosterEntry = namedtuple(
+    "RosterEntry", "membership_id user_id username role status joined_at"
+)
+
+# teams per membership query in TeamQuerySet.rebuild_counters
+COUNTER_CHUNK_SIZE = 500
+
 # ------------------------------------------------------------------------------
 
-class TeamManager(models.Manager):
+class TeamQuerySet(models.QuerySet):
+
+    def with_membership_for(self, user):
+        """
+        Annotates each team with ``viewer_role`` and ``viewer_status`` of
+        ``user``'s membership (``None`` for non-members) in the same query.
+        """
+        user_id = getattr(user, "pk", None)
+        if user_id is None:
+            return self.extra(select=OrderedDict([
+                ("viewer_role", "NULL"),
+                ("viewer_status", "NULL"),
+            ]))
+        subquery = (
+            "SELECT {membership}.{column} FROM {membership} "
+            "WHERE {membership}.team_id = {team}.id "
+            "AND {membership}.user_id = %s LIMIT 1"
+        )
+        tables = {
+            "membership": Membership._meta.db_table,
+            "team": Team._meta.db_table,
+        }
+        return self.extra(
+            select=OrderedDict([
+                ("viewer_role", subquery.format(column="role", **tables)),
+                ("viewer_status", subquery.format(column="status", **tables)),
+            ]),
+            select_params=[user_id, user_id],
+        )
+
+    def visible_to(self, user):
+        """
+        Keeps the public teams and the teams ``user`` is an accepted member of.
+        """
+        visible = models.Q(public_visible=True)
+        if getattr(user, "pk", None) is not None:
+            visible |= models.Q(pk__in=Membership.objects.filter(
+                user=user, status__in=MembershipStatus.ACCEPTED_STATUSES
+            ).values("team_id"))
+        return self.filter(visible)
+
+    def joined_by(self, user):
+        """
+        Keeps the teams ``user`` is an accepted member of.
+        """
+        return self.filter(pk__in=Membership.objects.filter(
+            user=user, status__in=MembershipStatus.ACCEPTED_STATUSES
+        ).values("team_id"))
+
+    def across_shards(self, limit=None):
+        """
+        Evaluates the queryset on every team shard in parallel and returns up
+        to ``limit`` results merged in the queryset's order, which may only
+        name fields of the results. Unsharded, it is just ``list(self)``.
+        """
+        if not sharding.is_sharded():
+            return list(self if limit is None else self[:limit])
+
+        def fetch(alias):
+            queryset = self.using(alias)
+            return list(queryset if limit is None else queryset[:limit])
+
+        results = list(chain.from_iterable(sharding.fan_out(fetch)))
+        # one stable sort per ordering field, the last one first
+        for field in reversed(self.query.order_by):
+            name = field.lstrip("-")
+            results.sort(
+                key=lambda item: item[name] if isinstance(item, dict) else getattr(item, name),
+                reverse=field.startswith("-"),
+            )
+        return results if limit is None else results[:limit]
+
+    def seek(self, cursor=None):
+        """
+        Orders teams newest first and, given a cursor from
+        ``pagination.encode_cursor``, keeps only the teams after it.
+        """
+        queryset = self.order_by("-created_at", "-id")
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(
+                created_at__lte=created_at
+            ).exclude(
+                created_at=created_at, id__gte=pk
+            )
+        return queryset
+
+    def adjust_counters(self, team_id, deltas):
+        if deltas:
+            self.using(sharding.shard_for(team_id)).filter(pk=team_id).update(**dict(
+                (field, models.F(field) + delta)
+                for field, delta in deltas.items()
+            ))
+
+    def rebuild_counters(self):
+        """
+        Recomputes the membership counters of the teams in the queryset from
+        their membership rows and bumps the cache of the teams that had
+        drifted, once the fixes are committed. Returns how many there were.
+        """
+        current = dict(
+            (row[0], row[1:])
+            for row in self.values_list("pk", *Team.COUNTER_FIELDS)
+        )
+        expected = dict(
+            (team_id, dict.fromkeys(Team.COUNTER_FIELDS, 0))
+            for team_id in current
+        )
+        team_ids = sorted(current)
+        # one IN () per COUNTER_CHUNK_SIZE teams, below SQLite's parameter limit
+        for start in range(0, len(team_ids), COUNTER_CHUNK_SIZE):
+            rows = Membership.objects.using(self._db).filter(
+                team__in=team_ids[start:start + COUNTER_CHUNK_SIZE]
+            ).values_list("team_id", "status", "role").annotate(
+                count=models.Count("pk")
+            ).order_by()
+            for team_id, status, role, count in rows:
+                for field, delta in counter_deltas(None, (status, role)).items():
+                    expected[team_id][field] += delta * count
+
+        drifted = []
+        with transaction.atomic(using=self._db):
+            for team_id, counters in expected.items():
+                if current[team_id] != tuple(counters[f] for f in Team.COUNTER_FIELDS):
+                    Team.objects.using(sharding.shard_for(team_id)).filter(
+                        pk=team_id
+                    ).update(**counters)
+                    drifted.append(team_id)
+        for team_id in drifted:
+            cache.bump(team_id)
+        return len(drifted)
+
+class TeamManager(models.Manager.from_queryset(TeamQuerySet)):
     pass
 
 class Team(models.Model):
@@ -25,17 +174,91 @@ class Team(models.Model):
 
     name = models.CharField(max_length = 128)
     description = models.TextField(blank=True)
-    avatar = models.ImageField(upload_to=avatar_upload, blank=True)
+    avatar = models.ImageField(upload_to=avatar_upload, storage=avatar_storage, blank=True)
+    # JSON {variant: storage name}, filled in by team.avatars
+    avatar_variants = models.TextField(blank=True, editable=False)
     scope = models.IntegerField(default=1)
     public_visible = models.BooleanField(default=True)
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="teams_created")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # denormalized from Membership, see counter_deltas()
+    applied_count = models.IntegerField(default=0, editable=False)
+    invited_count = models.IntegerField(default=0, editable=False)
+    declined_count = models.IntegerField(default=0, editable=False)
+    rejected_count = models.IntegerField(default=0, editable=False)
+    accepted_count = models.IntegerField(default=0, editable=False)
+    member_count = models.IntegerField(default=0, editable=False)
+    manager_count = models.IntegerField(default=0, editable=False)
+    owner_count = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = (
+        "applied_count",
+        "invited_count",
+        "declined_count",
+        "rejected_count",
+        "accepted_count",
+        "member_count",
+        "manager_count",
+        "owner_count",
+    )
+
+    class Meta:
+        index_together = [("created_at", "id")]
+
     def __unicode__(self):
         return self.name
 
+    @property
+    def pending_count(self):
+        return self.applied_count + self.invited_count
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and sharding.is_sharded():
+            # the id picks the shard, so it has to be known before the INSERT;
+            # Team.objects.create() passes a using= that knows nothing of it
+            self.pk = sharding.allocate_team_id()
+            kwargs.update(force_insert=True, using=sharding.shard_for(self.pk))
+        elif not self._state.adding and not kwargs.get("force_insert") and \
+                kwargs.get("update_fields") is None:
+            # the counters only change through adjust_counters; writing back
+            # the values read earlier would undo concurrent increments
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super(Team, self).save(*args, **kwargs)
+        cache.bump(self.pk)
+
+    def delete(self, *args, **kwargs):
+        team_id = self.pk
+        super(Team, self).delete(*args, **kwargs)
+        cache.bump(team_id)
+
     def get_absolute_url(self):
-        return reverse("team_detail", args=[self.slug])
+        return reverse("team_detail", args=[self.pk])
+
+    def get_avatar_names(self):
+        names = list(self.get_avatar_variants().values())
+        if self.avatar:
+            names.append(self.avatar.name)
+        return names
+
+    def get_avatar_variants(self):
+        if not self.avatar_variants:
+            return {}
+        return json.loads(self.avatar_variants)
+
+    def avatar_url(self, variant="small"):
+        name = self.get_avatar_variants().get(variant)
+        if name:
+            return self.avatar.storage.url(name)
+        if self.avatar:
+            return self.avatar.url
+
+    @property
+    def small_avatar_url(self):
+        return self.avatar_url("small")
 
     @property
     def applicants(self):
@@ -64,6 +287,36 @@ class Team(models.Model):
     def members(self):
         return self.acceptances.filter(role=MembershipRole.MEMBER)
 
+    def roster(self, statuses=None, roles=None, chunk_size=2000):
+        """
+        Yields a ``RosterEntry`` per membership (accepted ones by default) in
+        membership order, without creating model instances. The username
+        comes from a join in the same query and rows are fetched in keyset
+        chunks of ``chunk_size``, so memory stays flat for any team size.
+        """
+        memberships = self.memberships.filter(
+            status__in=statuses or MembershipStatus.ACCEPTED_STATUSES
+        )
+        if roles is not None:
+            memberships = memberships.filter(role__in=roles)
+        sharded = sharding.is_sharded()
+        columns = ["pk", "user_id", "role", "status", "created_at"]
+        if not sharded:
+            columns.insert(2, "user__username")
+        rows = memberships.order_by("pk").values_list(*columns)
+        last_pk = 0
+        while True:
+            chunk = list(rows.filter(pk__gt=last_pk)[:chunk_size])
+            if sharded:
+                # the users are not on the team's shard
+                names = sharding.usernames(row[1] for row in chunk)
+                chunk = [row[:2] + (names.get(row[1]),) + row[2:] for row in chunk]
+            for row in chunk:
+                yield RosterEntry._make(row)
+            if len(chunk) < chunk_size:
+                break
+            last_pk = chunk[-1][0]
+
     @property
     def managers(self):
         return self.acceptances.filter(role=MembershipRole.MANAGER)
@@ -73,35 +326,134 @@ class Team(models.Model):
         return self.acceptances.filter(role=MembershipRole.OWNER)
 
     def is_owner_or_manager(self, user):
-        return self.acceptances.filter(
-            role__in=[
-                MembershipRole.OWNER,
-                MembershipRole.MANAGER,
-            ],
-            user=user
-        ).exists()
+        membership = self.for_user(user)
+        return membership is not None and membership.is_accepted() and \
+            membership.role in MembershipRole.AUTHORITY_ROLES
 
     def is_member(self, user):
-        return self.members.filter(user=user).exists()
+        membership = self.for_user(user)
+        return membership is not None and membership.is_accepted() and \
+            membership.is_member()
 
     def is_manager(self, user):
-        return self.managers.filter(user=user).exists()
+        membership = self.for_user(user)
+        return membership is not None and membership.is_accepted() and \
+            membership.is_manager()
 
     def is_owner(self, user):
-        return self.owners.filter(user=user).exists()
+        membership = self.for_user(user)
+        return membership is not None and membership.is_accepted() and \
+            membership.is_owner()
 
     def is_on_team(self, user):
-        return self.acceptances.filter(user=user).exists()
+        membership = self.for_user(user)
+        return membership is not None and membership.is_accepted()
 
     def add_user(self, user, role):
         status = MembershipStatus.INVITED
-        membership, _ = self.memberships.get_or_create(
-            user=user,
-            defaults={"role": role, "status": status}
-        )
-        signals.added_member.send(sender=self, membership=membership)
+        with signals.membership_change(using=sharding.shard_for(self.pk)) as pending:
+            membership, _ = self.memberships.get_or_create(
+                user=user,
+                defaults={"role": role, "status": status}
+            )
+            pending.send(signals.added_member, self, membership=membership)
         return membership
 
+    def add_users(self, users, role, chunk_size=500):
+        """
+        Invites ``users`` (instances or primary keys) with ``role`` in chunks
+        of ``chunk_size``, skipping users that already have a membership.
+        Each chunk is one transaction with a single ``bulk_create`` and sends
+        ``added_members`` once. Returns the created memberships.
+        """
+        users = list(users)
+        created = []
+        for start in range(0, len(users), chunk_size):
+            created.extend(self._add_users_chunk(users[start:start + chunk_size], role))
+        return created
+
+    def _add_users_chunk(self, users, role):
+        status = MembershipStatus.INVITED
+        user_ids = set(getattr(user, "pk", user) for user in users)
+        using = sharding.shard_for(self.pk)
+        with signals.membership_change(using=using) as pending:
+            existing = self.memberships.filter(
+                user__in=user_ids
+            ).values_list("user_id", flat=True)
+            user_ids.difference_update(existing)
+            if not user_ids:
+                return []
+            Membership.objects.using(using).bulk_create([
+                Membership(team=self, user_id=user_id, role=role, status=status)
+                for user_id in sorted(user_ids)
+            ])
+            # bulk_create does not return primary keys on every backend
+            memberships = list(self.memberships.filter(user__in=user_ids))
+            Team.objects.adjust_counters(self.pk, dict(
+                (field, delta * len(memberships))
+                for field, delta in counter_deltas(None, (status, role)).items()
+            ))
+            invalidate(self.pk)
+
+            pending.send(signals.added_members, self, memberships=memberships)
+            # the drain worker may have receivers this process does not
+            if signals.is_async() or signals.added_member.has_listeners(self):
+                for membership in memberships:
+                    pending.send(signals.added_member, self, membership=membership)
+        return memberships
+
+    def accept_applicants(self, ids, by, chunk_size=500):
+        return self._moderate_applicants(
+            ids, by, MembershipStatus.ACCEPTED,
+            signals.accepted_memberships, signals.accepted_membership, chunk_size,
+        )
+
+    def reject_applicants(self, ids, by, chunk_size=500):
+        return self._moderate_applicants(
+            ids, by, MembershipStatus.REJECTED,
+            signals.rejected_memberships, signals.rejected_membership, chunk_size,
+        )
+
+    def _moderate_applicants(self, ids, by, status, batch_signal, signal, chunk_size):
+        """
+        Moves the applicants among the memberships ``ids`` to ``status`` with
+        one set-based UPDATE per chunk, after checking once that ``by`` may
+        moderate this team. Returns ``{membership id: applied}``.
+        """
+        ids = sorted(set(int(pk) for pk in ids))
+        outcomes = dict.fromkeys(ids, False)
+        if not ids or not self.is_owner_or_manager(by):
+            return outcomes
+
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            with signals.membership_change(using=sharding.shard_for(self.pk)) as pending:
+                roles = dict(self.applicants.select_for_update().filter(
+                    pk__in=chunk
+                ).values_list("pk", "role"))
+                if not roles:
+                    continue
+                self.applicants.filter(pk__in=roles).update(status=status)
+                deltas = defaultdict(int)
+                for role in roles.values():
+                    for field, delta in counter_deltas(
+                        (MembershipStatus.APPLIED, role), (status, role)
+                    ).items():
+                        deltas[field] += delta
+                Team.objects.adjust_counters(self.pk, deltas)
+                outcomes.update(dict.fromkeys(roles, True))
+
+                if signals.is_async() or batch_signal.has_listeners(self) or \
+                        signal.has_listeners():
+                    memberships = list(self.memberships.filter(pk__in=roles))
+                    pending.send(batch_signal, self, memberships=memberships)
+                    for membership in memberships:
+                        pending.send(signal, membership, membership=membership)
+            # with nothing pending, membership_change has no team to bump
+            cache.bump(self.pk)
+        invalidate(self.pk)
+        return outcomes
+
 ##    def invite_user(self, from_user, to_email, role, message=None):
 ##        if not JoinInvitation.objects.filter(signup_code__email=to_email).exists():
 ##            invite = JoinInvitation.invite(from_user, to_email, message, send=False)
@@ -115,6 +467,14 @@ class Team(models.Model):
 
 
     def for_user(self, user):
+        resolver = get_resolver()
+        if resolver is not None:
+            return resolver.for_user(self, user)
+        return self._load_membership(user)
+
+    def _load_membership(self, user):
+        if getattr(user, "pk", user) is None:
+            return None
         try:
             return self.memberships.get(user=user)
         except Membership.DoesNotExist:
@@ -140,12 +500,65 @@ class MembershipStatus(object):
     ACCEPTED = 4
     AUTO_JOINED = 5
 
+    ACCEPTED_STATUSES = (ACCEPTED, AUTO_JOINED)
+
 class MembershipRole(object):
 
     MEMBER = 0
     MANAGER = 1
     OWNER = 2
 
+    # roles allowed to move other memberships through MEMBERSHIP_TRANSITIONS
+    AUTHORITY_ROLES = (MANAGER, OWNER)
+
+MembershipTransition = namedtuple("MembershipTransition", "field source target signal")
+
+MEMBERSHIP_TRANSITIONS = {
+    "promote": MembershipTransition(
+        "role", MembershipRole.MEMBER, MembershipRole.MANAGER, signals.promoted_member
+    ),
+    "demote": MembershipTransition(
+        "role", MembershipRole.MANAGER, MembershipRole.MEMBER, signals.demoted_member
+    ),
+    "accept": MembershipTransition(
+        "status", MembershipStatus.APPLIED, MembershipStatus.ACCEPTED, signals.accepted_membership
+    ),
+    "reject": MembershipTransition(
+        "status", MembershipStatus.APPLIED, MembershipStatus.REJECTED, signals.rejected_membership
+    ),
+}
+
+STATUS_COUNTERS = {
+    MembershipStatus.APPLIED: "applied_count",
+    MembershipStatus.INVITED: "invited_count",
+    MembershipStatus.DECLINED: "declined_count",
+    MembershipStatus.REJECTED: "rejected_count",
+    MembershipStatus.ACCEPTED: "accepted_count",
+    MembershipStatus.AUTO_JOINED: "accepted_count",
+}
+
+ROLE_COUNTERS = {
+    MembershipRole.MEMBER: "member_count",
+    MembershipRole.MANAGER: "manager_count",
+    MembershipRole.OWNER: "owner_count",
+}
+
+def counter_deltas(before, after):
+    """
+    Returns the Team counter changes for a membership moving from the
+    ``(status, role)`` pair ``before`` to ``after``; ``None`` stands for a
+    missing row. Role counters only cover accepted memberships.
+    """
+    deltas = defaultdict(int)
+    for state, step in [(before, -1), (after, 1)]:
+        if state is None:
+            continue
+        status, role = state
+        deltas[STATUS_COUNTERS[status]] += step
+        if status in MembershipStatus.ACCEPTED_STATUSES:
+            deltas[ROLE_COUNTERS[role]] += step
+    return dict((field, delta) for field, delta in deltas.items() if delta)
+
 class Invitation(models.Model):
         
     created_at = models.DateTimeField(auto_now_add = True)
@@ -174,9 +587,51 @@ class Membership(models.Model):
     status = models.IntegerField(default=MembershipStatus.APPLIED, choices = STATUS_CHOICES)
     created_at = models.DateTimeField(auto_now_add = True)
 
+    # (status, role) as last read from or written to the database
+    _counted_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Membership, cls).from_db(db, field_names, values)
+        if "status" in field_names and "role" in field_names:
+            instance._counted_state = (instance.status, instance.role)
+        return instance
+
+    def _stored_state(self):
+        if self._state.adding:
+            return None
+        if self._counted_state is None:
+            return Membership.objects.using(sharding.shard_for(self.team_id)).filter(
+                pk=self.pk
+            ).values_list("status", "role").first()
+        return self._counted_state
+
+    def save(self, *args, **kwargs):
+        using = sharding.shard_for(self.team_id)
+        if using is not None:
+            # Membership.objects.create() would pass the unsharded default
+            kwargs["using"] = using
+        with transaction.atomic(using=using):
+            before = self._stored_state()
+            super(Membership, self).save(*args, **kwargs)
+            after = (self.status, self.role)
+            Team.objects.adjust_counters(self.team_id, counter_deltas(before, after))
+        self._counted_state = after
+        cache.bump(self.team_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=sharding.shard_for(self.team_id)):
+            before = self._stored_state()
+            super(Membership, self).delete(*args, **kwargs)
+            Team.objects.adjust_counters(self.team_id, counter_deltas(before, None))
+        self._counted_state = None
+        cache.bump(self.team_id)
+
+    def is_accepted(self):
+        return self.status in MembershipStatus.ACCEPTED_STATUSES
 
     def is_owner(self):
-        return self.role == MembershipRole.ROLE_OWNER
+        return self.role == MembershipRole.OWNER
 
     def is_manager(self):
         return self.role == MembershipRole.MANAGER
@@ -184,45 +639,53 @@ class Membership(models.Model):
     def is_member(self):
         return self.role == MembershipRole.MEMBER
 
+    def transition(self, name, by):
+        """
+        Applies the transition ``name`` from ``MEMBERSHIP_TRANSITIONS`` on
+        behalf of ``by`` as one conditional UPDATE. The row must still hold
+        the status and role this instance last saw and ``by`` must be an
+        accepted manager or owner of the team; both are checked in the UPDATE
+        itself. Returns whether the transition applied, the signal is sent
+        only then.
+        """
+        transition = MEMBERSHIP_TRANSITIONS[name]
+        by_id = getattr(by, "pk", by)
+        if by_id is None or getattr(self, transition.field) != transition.source:
+            return False
+
+        before = (self.status, self.role)
+        using = sharding.shard_for(self.team_id)
+        with signals.membership_change(using=using) as pending:
+            updated = Membership.objects.using(using).filter(
+                pk=self.pk,
+                status=self.status,
+                role=self.role,
+                team__memberships__user=by_id,
+                team__memberships__role__in=MembershipRole.AUTHORITY_ROLES,
+                team__memberships__status__in=MembershipStatus.ACCEPTED_STATUSES,
+            ).update(**{transition.field: transition.target})
+            if not updated:
+                return False
+            setattr(self, transition.field, transition.target)
+            after = (self.status, self.role)
+            Team.objects.adjust_counters(self.team_id, counter_deltas(before, after))
+            self._counted_state = after
+            invalidate(self.team_id, self.user_id)
+
+            pending.send(transition.signal, self, membership=self)
+        return True
+
     def promote(self, by):
-        role = self.team.role_for(by)
-        if role in [MembershipRole.MANAGER, MembershipRole.OWNER]:
-            if self.role == MembershipRole.MEMBER:
-                self.role = MembershipRole.MANAGER
-                self.save()
-                signals.promoted_member.send(sender=self, membership=self)
-                return True
-        return False
+        return self.transition("promote", by)
 
     def demote(self, by):
-        role = self.team.role_for(by)
-        if role in [MembershipRole.MANAGER, MembershipRole.OWNER]:
-            if self.role == MembershipRole.MANAGER:
-                self.role = MembershipRole.MEMBER
-                self.save()
-                signals.demoted_member.send(sender=self, membership=self)
-                return True
-        return False
+        return self.transition("demote", by)
 
     def accept(self, by):
-        role = self.team.role_for(by)
-        if role in [MembershipRole.MANAGER, MembershipRole.OWNER]:
-            if self.status == MembershipStatus.APPLIED:
-                self.status = MembershipStatus.ACCEPTED
-                self.save()
-                signals.accepted_membership.send(sender=self, membership=self)
-                return True
-        return False
+        return self.transition("accept", by)
 
     def reject(self, by):
-        role = self.team.role_for(by)
-        if role in [Membership.ROLE_MANAGER, Membership.ROLE_OWNER]:
-            if self.status == MembershipStatus.APPLIED:
-                self.status = MembershipStatus.REJECTED
-                self.save()
-                signals.rejected_membership.send(sender=self, membership=self)
-                return True
-        return False
+        return self.transition("reject", by)
 
     def joined(self):
         self.user = self.invite.to_user
@@ -232,7 +695,7 @@ class Membership(models.Model):
             self.status = MembershipStatus.INVITED
         self.save()
 
-    def status(self):
+    def status_display(self):
         if self.user:
             return self.get_status_display()
         if self.invite:
@@ -245,14 +708,16 @@ class Membership(models.Model):
             code.expiry = timezone.now() + datetime.timedelta(days=5)
             code.save()
             code.send()
-            signals.resent_invite.send(sender=self, membership=self)
+            with signals.membership_change(using=sharding.shard_for(self.team_id)) as pending:
+                pending.send(signals.resent_invite, self, membership=self)
 
     def remove(self):
-        if self.invite is not None:
-            self.invite.signup_code.delete()
-            self.invite.delete()
-        self.delete()
-        signals.removed_membership.send(sender=Membership, team=self.team, user=self.user)
+        with signals.membership_change(using=sharding.shard_for(self.team_id)) as pending:
+            if self.invite is not None:
+                self.invite.signup_code.delete()
+                self.invite.delete()
+            self.delete()
+            pending.send(signals.removed_membership, Membership, team=self.team, user=self.user)
 
     @property
     def invitee(self):
@@ -262,4 +727,85 @@ class Membership(models.Model):
         return u"{0} in {1}".format(self.user, self.team)
 
     class Meta:
-        unique_together = [("team", "user", "invite")]
\ No newline at end of file
+        unique_together = [("team", "user", "invite")]
+        index_together = [
+            # Team.applicants / acceptances / members ... and Team.is_*
+            ("team", "status", "role", "user"),
+            # a user's memberships by status
+            ("user", "status"),
+            # admin list filters
+            ("status", "role"),
+        ]
+
+
+def membership_matrix(pairs, chunk_size=400):
+    """
+    Answers many "what is user U on team T" questions at once. ``pairs`` are
+    ``(user_id, team_id)``; returns ``{(user_id, team_id): (role, status)}``
+    for the pairs with an accepted membership. The pairs are grouped by team
+    and each chunk of ``chunk_size`` pairs is a single query; with sharded
+    teams the shards are queried in parallel.
+    """
+    pairs = set((int(user_id), int(team_id)) for user_id, team_id in pairs)
+    by_shard = defaultdict(list)
+    for pair in pairs:
+        by_shard[sharding.shard_for(pair[1])].append(pair)
+    found = {}
+    for rows in sharding.fan_out(
+        lambda using: _membership_matrix(by_shard[using], chunk_size, using),
+        list(by_shard),
+    ):
+        found.update(rows)
+    return found
+
+
+def _membership_matrix(pairs, chunk_size, using):
+    pairs = sorted(pairs, key=lambda pair: (pair[1], pair[0]))
+    found = {}
+    for start in range(0, len(pairs), chunk_size):
+        by_team = defaultdict(list)
+        for user_id, team_id in pairs[start:start + chunk_size]:
+            by_team[team_id].append(user_id)
+        condition = models.Q()
+        for team_id, user_ids in by_team.items():
+            condition |= models.Q(team_id=team_id, user_id__in=user_ids)
+        rows = Membership.objects.using(using).filter(
+            condition, status__in=MembershipStatus.ACCEPTED_STATUSES
+        ).values_list("user_id", "team_id", "role", "status")
+        for user_id, team_id, role, status in rows:
+            found[(user_id, team_id)] = (role, status)
+    return found
+
+
+class OutboxEvent(models.Model):
+    """
+    A team signal waiting to be delivered by ``drain_team_outbox``, see
+    ``signals.membership_change``.
+    """
+
+    team_id = models.IntegerField()
+    signal = models.CharField(max_length=64)
+    payload = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    failed = models.BooleanField(default=False)
+
+    class Meta:
+        index_together = [("failed", "id")]
+
+    def __unicode__(self):
+        return u"{0} for team {1}".format(self.signal, self.team_id)
+
+
+class TeamSequence(models.Model):
+    """
+    Hands out team ids when teams are sharded, see
+    ``sharding.allocate_team_id``. Rows are deleted as soon as they are
+    created, only the table's sequence is used.
+    """
+
+
+models.signals.post_save.connect(membership_changed, sender=Membership)
+models.signals.post_delete.connect(membership_changed, sender=Membership)
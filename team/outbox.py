@@ -0,0 +1,130 @@
+import json
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import models
+from django.utils import timezone
+
+from . import sharding, signals
+from .models import Membership, OutboxEvent, Team
+
+# ------------------------------------------------------------------------------
+# Signal arguments are stored as references (model label + primary key) and
+# loaded again when the event is delivered, so receivers see the current rows.
+
+SIGNAL_NAMES = dict((signal, name) for name, signal in signals.SIGNALS.items())
+
+
+def _label(model):
+    return "%s.%s" % (model._meta.app_label, model._meta.model_name)
+
+
+def encode(value):
+    if isinstance(value, models.Model):
+        return {"instance": _label(value), "pk": value.pk}
+    if isinstance(value, type) and issubclass(value, models.Model):
+        return {"model": _label(value)}
+    if isinstance(value, (list, tuple)) and value and \
+            all(isinstance(item, models.Model) for item in value):
+        return {"instances": _label(value[0]), "pks": [item.pk for item in value]}
+    return value
+
+
+def _manager(label, using):
+    # team rows are read from the event's shard, anything else as usual
+    manager = apps.get_model(label)._default_manager
+    if label in sharding.SHARDED_MODELS:
+        manager = manager.db_manager(using)
+    return manager
+
+
+def decode(value, using=None):
+    if not isinstance(value, dict):
+        return value
+    if "model" in value:
+        return apps.get_model(value["model"])
+    if "instances" in value:
+        found = _manager(value["instances"], using).in_bulk(value["pks"])
+        return [found[pk] for pk in value["pks"] if pk in found]
+    return _manager(value["instance"], using).filter(pk=value["pk"]).first()
+
+
+def team_id_for(sender, kwargs):
+    candidates = [sender, kwargs.get("membership"), kwargs.get("team")]
+    candidates.extend(kwargs.get("memberships") or [])
+    for value in candidates:
+        if isinstance(value, Team):
+            return value.pk
+        if isinstance(value, Membership):
+            return value.team_id
+
+
+def enqueue(signal, sender, using=None, **kwargs):
+    return OutboxEvent.objects.using(using).create(
+        team_id=team_id_for(sender, kwargs),
+        signal=SIGNAL_NAMES[signal],
+        payload=json.dumps({
+            "sender": encode(sender),
+            "kwargs": dict((key, encode(value)) for key, value in kwargs.items()),
+        }),
+    )
+
+# ------------------------------------------------------------------------------
+
+def deliver(event):
+    payload = json.loads(event.payload)
+    using = sharding.shard_for(event.team_id)
+    kwargs = dict(
+        (str(key), decode(value, using)) for key, value in payload["kwargs"].items()
+    )
+    responses = signals.SIGNALS[event.signal].send_robust(
+        sender=decode(payload["sender"], using), **kwargs
+    )
+    for receiver, response in responses:
+        if isinstance(response, Exception):
+            raise response
+
+
+def drain(batch_size=100, max_attempts=5, backoff=2, using=None):
+    """
+    Delivers up to ``batch_size`` pending events of the database ``using``
+    (a team shard) in creation order. Events of
+    a team are delivered strictly in order: after a failure the team's later
+    events wait until the failed one has been retried, with exponential
+    backoff, or has been given up on after ``max_attempts``.
+    Returns ``(delivered, retried, failed)`` counts.
+    """
+    now = timezone.now()
+    outbox = OutboxEvent.objects.using(using)
+    waiting = outbox.filter(
+        failed=False, available_at__gt=now
+    ).values("team_id")
+    events = outbox.filter(failed=False).exclude(
+        team_id__in=waiting
+    ).order_by("id")[:batch_size]
+
+    blocked = set()
+    delivered = []
+    retried = failed = 0
+    for event in events:
+        if event.team_id in blocked:
+            continue
+        try:
+            deliver(event)
+        except Exception as e:
+            blocked.add(event.team_id)
+            event.attempts += 1
+            event.last_error = "%s: %s" % (type(e).__name__, e)
+            if event.attempts >= max_attempts:
+                event.failed = True
+                failed += 1
+            else:
+                event.available_at = now + timedelta(seconds=backoff ** event.attempts)
+                retried += 1
+            event.save(update_fields=["attempts", "last_error", "failed", "available_at"])
+        else:
+            delivered.append(event.pk)
+
+    if delivered:
+        outbox.filter(pk__in=delivered).delete()
+    return len(delivered), retried, failed
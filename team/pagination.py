@@ -0,0 +1,60 @@
+import base64
+import binascii
+
+from django.core.paginator import Paginator
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = "%s|%d" % (created_at.isoformat(), pk)
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Returns the ``(created_at, pk)`` position encoded by ``encode_cursor``.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii")
+        created_at, pk = raw.rsplit("|", 1)
+        created_at, pk = parse_datetime(created_at), int(pk)
+    except (TypeError, ValueError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if created_at is None:
+        raise InvalidCursor(cursor)
+    return created_at, pk
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an exact COUNT(*) over a whole table. An
+    unfiltered queryset is estimated from its primary key range, a filtered
+    one is counted up to ``count_limit`` rows.
+    """
+
+    count_limit = 10000
+
+    _estimated_count = None
+
+    @property
+    def count(self):
+        if self._estimated_count is None:
+            self._estimated_count = self._estimate_count()
+        return self._estimated_count
+
+    def _estimate_count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, "query"):
+            return len(queryset)
+        if not queryset.query.where:
+            bounds = queryset.aggregate(low=Min("pk"), high=Max("pk"))
+            if bounds["high"] is None:
+                return 0
+            return bounds["high"] - bounds["low"] + 1
+        return queryset[:self.count_limit].count()
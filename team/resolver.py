@@ -0,0 +1,76 @@
+import threading
+from contextlib import contextmanager
+
+from . import cache
+
+# ------------------------------------------------------------------------------
+# Memberships looked up during a request (or any other unit of work) are kept
+# here so that Team.is_* / role_for / status_for share a single query per
+# (team, user) pair. Outside of a scope every lookup goes to the database.
+
+_state = threading.local()
+
+_MISSING = object()
+
+
+class MembershipResolver(object):
+
+    def __init__(self):
+        self._memberships = {}
+
+    def for_user(self, team, user):
+        key = (team.pk, getattr(user, "pk", user))
+        membership = self._memberships.get(key, _MISSING)
+        if membership is _MISSING:
+            membership = team._load_membership(user)
+            self._memberships[key] = membership
+        return membership
+
+    def invalidate(self, team_id, user_id=None):
+        if user_id is None:
+            for key in [key for key in self._memberships if key[0] == team_id]:
+                del self._memberships[key]
+        else:
+            self._memberships.pop((team_id, user_id), None)
+
+    def clear(self):
+        self._memberships.clear()
+
+
+def get_resolver():
+    return getattr(_state, "resolver", None)
+
+
+def activate():
+    _state.resolver = MembershipResolver()
+
+
+def deactivate():
+    _state.resolver = None
+
+
+@contextmanager
+def membership_scope():
+    resolver = get_resolver()
+    if resolver is not None:
+        yield resolver
+        return
+    activate()
+    try:
+        yield get_resolver()
+    finally:
+        deactivate()
+
+
+def invalidate(team_id, user_id=None):
+    resolver = get_resolver()
+    if resolver is not None:
+        resolver.invalidate(team_id, user_id)
+
+# ------------------------------------------------------------------------------
+
+def membership_changed(sender, instance, **kwargs):
+    invalidate(instance.team_id, instance.user_id)
+    # Membership.save/delete bump again once their transaction is done, but
+    # cascading deletes (a user or team going away) only send post_delete
+    cache.bump(instance.team_id)
@@ -0,0 +1,59 @@
+from django.db import connections, router
+from django.db.migrations.recorder import MigrationRecorder
+
+from . import search
+from .models import Team
+
+# ------------------------------------------------------------------------------
+# Schema objects created with raw SQL, which Django's migration state does not
+# know about: the NOCASE name index of migration 0009 and the search triggers
+# of migration 0010. On SQLite, Django applies most AddField and AlterField
+# operations by copying team_team into a new table, which drops both. repair()
+# runs after every migrate and puts back whatever is missing.
+
+NAME_INDEX = "team_team_name_prefix"
+NAME_INDEX_SQL = "CREATE INDEX {name} ON {table} ({column} COLLATE NOCASE)"
+
+
+def _applied(connection, name):
+    return ("team", name) in MigrationRecorder(connection).applied_migrations()
+
+
+def repair(connection):
+    """
+    Recreates the raw indexes and triggers of team_team that are missing.
+    Returns the names of what it recreated.
+    """
+    if connection.vendor != "sqlite":
+        return []
+    table = Team._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE tbl_name = %s "
+            "AND type IN ('index', 'trigger')",
+            [table],
+        )
+        existing = set(row[0] for row in cursor.fetchall())
+
+    repaired = []
+    if _applied(connection, "0009_admin_indexes") and NAME_INDEX not in existing:
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(NAME_INDEX_SQL.format(
+                name=quote(NAME_INDEX), table=quote(table), column=quote("name")
+            ))
+        repaired.append(NAME_INDEX)
+
+    search.forget(connection)
+    triggers = set(name.format(fts=search.FTS_TABLE) for name in search.TRIGGERS)
+    if search.is_installed(connection) and not triggers <= existing:
+        # rows changed while the triggers were gone are picked up by the rebuild
+        search.uninstall(connection)
+        search.install(connection)
+        repaired.append(search.FTS_TABLE)
+    return repaired
+
+
+def repair_after_migrate(sender, using, **kwargs):
+    if router.allow_migrate_model(using, Team):
+        repair(connections[using])
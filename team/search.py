@@ -0,0 +1,159 @@
+import re
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+
+from .models import Team
+
+# ------------------------------------------------------------------------------
+# On SQLite with FTS5 the team names and descriptions are indexed in an
+# external-content FTS5 table that triggers keep in sync with team_team. The
+# index stores 2 and 3 character prefixes, so autocomplete queries ("pin*")
+# are answered from the index instead of a scan of the term list.
+# Migrations that make Django rebuild team_team drop the triggers with the old
+# table; team.schema.repair() installs the index again after every migrate.
+
+FTS_TABLE = "team_team_fts"
+
+# bm25 column weights: a hit in the name counts ten times one in the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# a shorter last word is matched as a whole word, not as a prefix
+MIN_PREFIX = 2
+
+MAX_RESULTS = 50
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE {fts} USING fts5("
+    "name, description, content='{table}', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    # counter updates rewrite the row but must not touch the index
+    "CREATE TRIGGER {fts}_update AFTER UPDATE ON {table} "
+    "WHEN old.name IS NOT new.name OR old.description IS NOT new.description BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO {fts}(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+]
+
+TRIGGERS = ["{fts}_insert", "{fts}_delete", "{fts}_update"]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS {fts}_insert",
+    "DROP TRIGGER IF EXISTS {fts}_delete",
+    "DROP TRIGGER IF EXISTS {fts}_update",
+    "DROP TABLE IF EXISTS {fts}",
+]
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql.format(fts=FTS_TABLE, table=Team._meta.db_table))
+
+
+# is_installed() answers per database, cleared by install() and uninstall()
+_installed = {}
+
+
+def _key(connection):
+    return connection.alias, connection.settings_dict["NAME"]
+
+
+def forget(connection):
+    _installed.pop(_key(connection), None)
+
+
+def install(connection):
+    """
+    Creates and fills the full-text index. Returns ``False`` when the
+    database is not SQLite or SQLite was built without FTS5.
+    """
+    if connection.vendor != "sqlite":
+        return False
+    forget(connection)
+    try:
+        with transaction.atomic(using=connection.alias):
+            _execute(connection, CREATE_SQL)
+    except DatabaseError:
+        return False
+    rebuild(connection)
+    return True
+
+
+def uninstall(connection):
+    if connection.vendor == "sqlite":
+        forget(connection)
+        _execute(connection, DROP_SQL)
+
+
+def rebuild(connection):
+    _execute(connection, ["INSERT INTO {fts}({fts}) VALUES ('rebuild')"])
+
+
+def is_installed(connection):
+    if connection.vendor != "sqlite":
+        return False
+    key = _key(connection)
+    if key not in _installed:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [FTS_TABLE],
+            )
+            _installed[key] = cursor.fetchone() is not None
+    return _installed[key]
+
+# ------------------------------------------------------------------------------
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def match_expression(query):
+    """
+    Turns user input into an FTS5 query that matches teams containing every
+    word, the last one as a prefix. Returns ``None`` for input without words.
+    """
+    words = WORD.findall(query)
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    if len(words[-1]) >= MIN_PREFIX:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_teams(query, user, limit=20, using="default"):
+    """
+    Returns up to ``limit`` teams matching ``query`` that ``user`` may see,
+    best match first. Falls back to a LIKE search when the full-text index is
+    not installed.
+    """
+    words = WORD.findall(query)
+    limit = min(limit, MAX_RESULTS)
+    if not words or limit <= 0:
+        return Team.objects.none()
+    teams = Team.objects.using(using).visible_to(user)
+
+    if not is_installed(connections[using]):
+        for word in words:
+            teams = teams.filter(Q(name__icontains=word) | Q(description__icontains=word))
+        return teams.order_by("name", "pk")[:limit]
+
+    table = Team._meta.db_table
+    return teams.extra(
+        select={"rank": "bm25(%s, %s, %s)" % (FTS_TABLE, NAME_WEIGHT, DESCRIPTION_WEIGHT)},
+        tables=[FTS_TABLE],
+        where=[
+            "%s.rowid = %s.id" % (FTS_TABLE, table),
+            "%s MATCH %%s" % FTS_TABLE,
+        ],
+        params=[match_expression(query)],
+        order_by=["rank"],
+    )[:limit]
@@ -0,0 +1,170 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+
+# ------------------------------------------------------------------------------
+# With TEAM_SHARDS set to a list of database aliases, every team lives on
+# the shard ``TEAM_SHARDS[team_id % len(TEAM_SHARDS)]`` together with its
+# memberships, their invitations and its outbox events, so a team's writes
+# only ever take that shard's lock. Team ids are handed out by the
+# TeamSequence table on ``default``, which keeps them unique across shards.
+# Users stay on ``default``; shards only hold the team app's tables, so
+# nothing may join memberships to users there, see ``usernames``.
+#
+# Queries scoped to one team are routed by TeamShardRouter when Django
+# passes it an instance (related managers, save, delete); others have to be
+# sent with ``.using(shard_for(team_id))``. Queries over all teams run on
+# every shard in parallel through ``fan_out``.
+#
+# Without TEAM_SHARDS nothing changes: ``shard_for`` returns None, which
+# leaves the choice of database to the other routers.
+
+SHARDED_MODELS = ("team.team", "team.membership", "team.invitation", "team.outboxevent")
+
+# what ``usernames`` passes to a single IN (), below SQLite's parameter limit
+USERNAME_CHUNK_SIZE = 500
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _label(model):
+    return "%s.%s" % (model._meta.app_label, model._meta.model_name)
+
+
+def shards():
+    """
+    Returns the aliases of the databases holding teams.
+    """
+    return list(getattr(settings, "TEAM_SHARDS", None) or ["default"])
+
+
+def is_sharded():
+    return len(shards()) > 1
+
+
+def shard_for(team_id):
+    """
+    Returns the alias of the shard holding team ``team_id``, or ``None``
+    when teams are not sharded.
+    """
+    aliases = shards()
+    if len(aliases) < 2 or team_id is None:
+        return None
+    return aliases[int(team_id) % len(aliases)]
+
+
+def allocate_team_id():
+    """
+    Returns a new team id, unique across shards.
+    """
+    from .models import TeamSequence
+
+    with transaction.atomic(using="default"):
+        sequence = TeamSequence.objects.using("default").create()
+        team_id = sequence.pk
+        # AUTOINCREMENT never hands out an id twice, the row is not needed;
+        # delete() also resets sequence.pk to None
+        sequence.delete()
+    return team_id
+
+
+def _close_if_obsolete(alias):
+    connections[alias].close_if_unusable_or_obsolete()
+
+
+def _run(args):
+    func, alias = args
+    try:
+        return func(alias)
+    finally:
+        # pool threads never see request_finished, which does this elsewhere
+        _close_if_obsolete(alias)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(len(shards()))
+        return _pool
+
+
+def fan_out(func, aliases=None):
+    """
+    Calls ``func(alias)`` for every shard (or the given aliases) and returns
+    the results in the same order. The calls run in parallel in a thread
+    pool, each thread on its own connections, unless there is only one
+    alias or a transaction is open: the threads would not see its writes.
+    """
+    aliases = list(aliases if aliases is not None else shards())
+    if len(aliases) < 2 or any(
+        connections[alias].in_atomic_block for alias in set(aliases + ["default"])
+    ):
+        return [func(alias) for alias in aliases]
+    return _get_pool().map(_run, [(func, alias) for alias in aliases])
+
+
+def usernames(user_ids):
+    """
+    Returns ``{user id: username}`` for ``user_ids``, read from the users'
+    own database in chunks.
+    """
+    User = get_user_model()
+    user_ids = sorted(set(user_id for user_id in user_ids if user_id is not None))
+    found = {}
+    for start in range(0, len(user_ids), USERNAME_CHUNK_SIZE):
+        found.update(User._default_manager.filter(
+            pk__in=user_ids[start:start + USERNAME_CHUNK_SIZE]
+        ).values_list("pk", User.USERNAME_FIELD))
+    return found
+
+# ------------------------------------------------------------------------------
+
+class TeamShardRouter(object):
+    """
+    Sends teams and their rows to their shard, using the instance Django
+    passes as a hint. Returns ``None`` (no opinion) for everything else and
+    when teams are not sharded, so it goes before the other routers.
+    """
+
+    def _db_for(self, model, hints):
+        if not is_sharded() or _label(model) not in SHARDED_MODELS:
+            return None
+        instance = hints.get("instance")
+        if instance is None or _label(type(instance)) not in SHARDED_MODELS:
+            return None
+        from .models import Team
+        if isinstance(instance, Team):
+            if instance.pk is not None:
+                return shard_for(instance.pk)
+        elif getattr(instance, "team_id", None) is not None:
+            return shard_for(instance.team_id)
+        # an invitation has no team, it goes where it was read from
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # memberships and teams point at users on another database
+        if is_sharded() and (_label(type(obj1)) in SHARDED_MODELS or
+                             _label(type(obj2)) in SHARDED_MODELS):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not is_sharded():
+            return None
+        if db in shards() and db != "default":
+            return app_label == "team"
+        # team ids are allocated on default, the team tables stay there too
+        if app_label == "team" and db != "default":
+            return False
+        return None
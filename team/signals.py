@@ -1,10 +1,61 @@
+from contextlib import contextmanager
+
 import django.dispatch
+from django.conf import settings
+from django.db import transaction
 
 added_member = django.dispatch.Signal(providing_args=["membership"])
+added_members = django.dispatch.Signal(providing_args=["memberships"])
 invited_user = django.dispatch.Signal(providing_args=["membership"])
 promoted_member = django.dispatch.Signal(providing_args=["membership"])
 demoted_member = django.dispatch.Signal(providing_args=["membership"])
 accepted_membership = django.dispatch.Signal(providing_args=["membership"])
+accepted_memberships = django.dispatch.Signal(providing_args=["memberships"])
 rejected_membership = django.dispatch.Signal(providing_args=["membership"])
+rejected_memberships = django.dispatch.Signal(providing_args=["memberships"])
 resent_invite = django.dispatch.Signal(providing_args=["membership"])
-removed_membership = django.dispatch.Signal(providing_args=["team", "user"])
\ No newline at end of file
+removed_membership = django.dispatch.Signal(providing_args=["team", "user"])
+
+SIGNALS = dict(
+    (name, value) for name, value in list(globals().items())
+    if isinstance(value, django.dispatch.Signal)
+)
+
+# ------------------------------------------------------------------------------
+
+def is_async():
+    return getattr(settings, "TEAM_SIGNAL_DISPATCH", "sync") == "async"
+
+
+class PendingSignals(object):
+
+    def __init__(self):
+        self.items = []
+
+    def send(self, signal, sender, **kwargs):
+        self.items.append((signal, sender, kwargs))
+
+
+@contextmanager
+def membership_change(using=None):
+    """
+    Runs a membership change in a transaction on ``using``, the team's
+    shard, and collects the signals it sends. With ``TEAM_SIGNAL_DISPATCH = "async"`` they are written to the
+    outbox inside that transaction and delivered by ``drain_team_outbox``,
+    otherwise they are sent once the block has finished. Either way the
+    cached data of the teams involved is invalidated after the block.
+    """
+    from . import cache
+    from .outbox import enqueue, team_id_for
+    pending = PendingSignals()
+    with transaction.atomic(using=using):
+        yield pending
+        if is_async():
+            for signal, sender, kwargs in pending.items:
+                enqueue(signal, sender, using=using, **kwargs)
+    for team_id in set(team_id_for(sender, kwargs) for signal, sender, kwargs in pending.items):
+        if team_id is not None:
+            cache.bump(team_id)
+    if not is_async():
+        for signal, sender, kwargs in pending.items:
+            signal.send(sender=sender, **kwargs)
\ No newline at end of file
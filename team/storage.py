@@ -0,0 +1,86 @@
+import errno
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+BLOB_NAME = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$")
+
+# mkstemp creates 0600 files; nginx serves the blobs as another user
+DEFAULT_FILE_MODE = 0o644
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 digest of its
+    content, sharded as ``<dir>/ab/cd/abcd....<ext>``. Saving content that is
+    already stored writes nothing and returns the existing name, so stored
+    files never change and can be cached forever.
+    """
+
+    incoming_dir = ".incoming"
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is derived from the content in _save()
+        return name
+
+    def _spool(self, content):
+        incoming = self.path(self.incoming_dir)
+        _makedirs(incoming)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    fp.write(chunk)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), tmp_path
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        digest, tmp_path = self._spool(content)
+
+        name = os.path.join(directory, digest[:2], digest[2:4], digest + ext)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.remove(tmp_path)
+            # referenced again: collect_avatar_blobs' grace period starts over
+            os.utime(full_path, None)
+            return name
+
+        _makedirs(os.path.dirname(full_path))
+        mode = self.file_permissions_mode
+        os.chmod(tmp_path, DEFAULT_FILE_MODE if mode is None else mode)
+        os.rename(tmp_path, full_path)
+        return name
+
+    def blobs(self, directory):
+        """
+        Yields ``(name, mtime)`` for every digest-named file under ``directory``.
+        """
+        root = self.path(directory)
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, self.location).replace(os.sep, "/")
+                if BLOB_NAME.match("/".join(name.split("/")[-3:])):
+                    yield name, os.path.getmtime(full_path)
@@ -1,6 +1,40 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
-from team.models import Team, Membership, avatar_upload, MembershipRole, MembershipStatus
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+from django.contrib.auth.models import AnonymousUser, User
+from first import metrics
+from team.models import Team, Membership, OutboxEvent, TeamSequence, avatar_upload, membership_matrix, MembershipRole, MembershipStatus
+from team import autocomplete, avatars, blacklist, cache, dumps, outbox, schema, search, sharding, signals
+from team.pagination import (
+    EstimatedCountPaginator,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+)
+from team.resolver import membership_scope
+from team.storage import ContentAddressedStorage
+from team.views import (
+    TeamAutocompleteUsersView,
+    TeamDetailView,
+    TeamExportView,
+    TeamListView,
+    TeamRosterExportView,
+    load_team_detail,
+)
 
 # import teams.receivers  # noqa - for django 1.6 tests
 
@@ -281,3 +315,1206 @@ class ManagerInviteMemberInvitationTests(BaseTeamTests):
         membership.status = MembershipStatus.DECLINED
         membership.save()
         self.assertFalse(team.can_join(paltman))
+
+
+class MembershipResolverTests(BaseTeamTests):
+
+    def _add(self, team, user, role, status=MembershipStatus.ACCEPTED):
+        return team.memberships.create(user=user, role=role, status=status)
+
+    def test_predicates_share_one_query(self):
+        team = self._create_team()
+        paltman = User.objects.create_user(username="paltman")
+        self._add(team, paltman, MembershipRole.MANAGER)
+        with membership_scope():
+            with self.assertNumQueries(1):
+                self.assertTrue(team.is_manager(paltman))
+                self.assertTrue(team.is_on_team(paltman))
+                self.assertTrue(team.is_owner_or_manager(paltman))
+                self.assertFalse(team.is_owner(paltman))
+                self.assertFalse(team.is_member(paltman))
+                self.assertEquals(team.role_for(paltman), MembershipRole.MANAGER)
+                self.assertEquals(team.status_for(paltman), MembershipStatus.ACCEPTED)
+
+    def test_unknown_user_is_cached(self):
+        team = self._create_team()
+        paltman = User.objects.create_user(username="paltman")
+        with membership_scope():
+            with self.assertNumQueries(1):
+                self.assertIsNone(team.for_user(paltman))
+                self.assertFalse(team.is_on_team(paltman))
+
+    def test_promote_invalidates(self):
+        team = self._create_team()
+        self._add(team, self.user, MembershipRole.OWNER)
+        paltman = User.objects.create_user(username="paltman")
+        membership = self._add(team, paltman, MembershipRole.MEMBER)
+        with membership_scope():
+            self.assertTrue(team.is_member(paltman))
+            self.assertTrue(membership.promote(self.user))
+            self.assertTrue(team.is_manager(paltman))
+            self.assertFalse(team.is_member(paltman))
+
+    def test_add_user_invalidates(self):
+        team = self._create_team()
+        paltman = User.objects.create_user(username="paltman")
+        with membership_scope():
+            self.assertIsNone(team.role_for(paltman))
+            team.add_user(paltman, MembershipRole.MEMBER)
+            self.assertEquals(team.role_for(paltman), MembershipRole.MEMBER)
+
+    def test_no_scope_queries_every_time(self):
+        team = self._create_team()
+        with self.assertNumQueries(2):
+            team.is_on_team(self.user)
+            team.is_owner(self.user)
+
+
+class TeamMembershipAnnotationTests(BaseTeamTests):
+
+    def test_with_membership_for(self):
+        first = self._create_team()
+        second = self._create_team()
+        first.memberships.create(
+            user=self.user,
+            role=MembershipRole.MANAGER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        with self.assertNumQueries(1):
+            teams = dict(
+                (team.pk, team)
+                for team in Team.objects.with_membership_for(self.user)
+            )
+        self.assertEquals(teams[first.pk].viewer_role, MembershipRole.MANAGER)
+        self.assertEquals(teams[first.pk].viewer_status, MembershipStatus.ACCEPTED)
+        self.assertIsNone(teams[second.pk].viewer_role)
+        self.assertIsNone(teams[second.pk].viewer_status)
+
+    def test_with_membership_for_anonymous(self):
+        self._create_team()
+        team = Team.objects.with_membership_for(None).get()
+        self.assertIsNone(team.viewer_role)
+
+
+class TeamCounterTests(BaseTeamTests):
+
+    def _reload(self, team):
+        return Team.objects.get(pk=team.pk)
+
+    def test_add_user_counts_invitee(self):
+        team = self._create_team()
+        paltman = User.objects.create_user(username="paltman")
+        team.add_user(paltman, MembershipRole.MEMBER)
+        team = self._reload(team)
+        self.assertEquals(team.invited_count, 1)
+        self.assertEquals(team.pending_count, 1)
+        self.assertEquals(team.member_count, 0)
+
+    def test_transitions_move_counters(self):
+        team = self._create_team()
+        team.memberships.create(
+            user=self.user,
+            role=MembershipRole.OWNER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        paltman = User.objects.create_user(username="paltman")
+        membership = team.memberships.create(user=paltman)
+        self.assertEquals(self._reload(team).applied_count, 1)
+
+        membership.accept(self.user)
+        team = self._reload(team)
+        self.assertEquals(team.applied_count, 0)
+        self.assertEquals(team.accepted_count, 2)
+        self.assertEquals(team.member_count, 1)
+
+        membership.promote(self.user)
+        team = self._reload(team)
+        self.assertEquals(team.member_count, 0)
+        self.assertEquals(team.manager_count, 1)
+
+        membership.delete()
+        team = self._reload(team)
+        self.assertEquals(team.accepted_count, 1)
+        self.assertEquals(team.manager_count, 0)
+        self.assertEquals(team.owner_count, 1)
+
+    def test_rebuild_counters_repairs_drift(self):
+        team = self._create_team()
+        team.memberships.create(
+            user=self.user,
+            role=MembershipRole.OWNER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        Team.objects.filter(pk=team.pk).update(accepted_count=7, owner_count=0)
+        version = cache.get_version(team.pk)
+        self.assertEquals(Team.objects.filter(pk=team.pk).rebuild_counters(), 1)
+        self.assertNotEqual(cache.get_version(team.pk), version)
+        team = self._reload(team)
+        self.assertEquals(team.accepted_count, 1)
+        self.assertEquals(team.owner_count, 1)
+        self.assertEquals(Team.objects.filter(pk=team.pk).rebuild_counters(), 0)
+
+    def test_save_keeps_concurrent_counter_updates(self):
+        team = self._create_team()
+        stale = self._reload(team)
+        team.memberships.create(
+            user=self.user,
+            role=MembershipRole.OWNER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        stale.name = "renamed"
+        stale.save()
+        team = self._reload(team)
+        self.assertEquals(team.name, "renamed")
+        self.assertEquals(team.accepted_count, 1)
+        self.assertEquals(team.owner_count, 1)
+
+
+class AddUsersTests(BaseTeamTests):
+
+    def test_add_users_skips_existing(self):
+        team = self._create_team()
+        users = [
+            User.objects.create_user(username="user%d" % i) for i in range(5)
+        ]
+        team.add_user(users[0], MembershipRole.MEMBER)
+
+        batches = []
+
+        def receiver(sender, memberships, **kwargs):
+            batches.append(memberships)
+
+        signals.added_members.connect(receiver)
+        try:
+            created = team.add_users(users, MembershipRole.MEMBER, chunk_size=2)
+        finally:
+            signals.added_members.disconnect(receiver)
+
+        self.assertEquals(
+            sorted(m.user_id for m in created),
+            sorted(user.pk for user in users[1:]),
+        )
+        self.assertEquals([len(batch) for batch in batches], [1, 2, 1])
+        self.assertEquals(team.invitees.count(), 5)
+        self.assertEquals(Team.objects.get(pk=team.pk).invited_count, 5)
+
+    def test_add_users_per_membership_fallback(self):
+        team = self._create_team()
+        users = [
+            User.objects.create_user(username="user%d" % i) for i in range(3)
+        ]
+        added = []
+
+        def receiver(sender, membership, **kwargs):
+            added.append(membership.user_id)
+
+        signals.added_member.connect(receiver)
+        try:
+            team.add_users([user.pk for user in users], MembershipRole.MEMBER)
+        finally:
+            signals.added_member.disconnect(receiver)
+        self.assertEquals(sorted(added), sorted(user.pk for user in users))
+
+    def test_import_memberships_counts_rows(self):
+        team = self._create_team()
+        users = [
+            User.objects.create_user(username="user%d" % i, email="user%d@example.com" % i)
+            for i in range(3)
+        ]
+        for username in ["shared1", "shared2"]:
+            User.objects.create_user(username=username, email="shared@example.com")
+        team.add_user(users[2], MembershipRole.MEMBER)
+
+        rows = [
+            {"user_id": str(users[0].pk)},
+            {"user_id": str(users[0].pk)},
+            {"username": "user1"},
+            {"email": "user2@example.com"},
+            {"email": "shared@example.com"},
+            {"user_id": "abc"},
+            {"username": "nobody"},
+        ]
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as fp:
+            fp.write("".join(json.dumps(row) + "\n" for row in rows))
+
+        out, err = StringIO(), StringIO()
+        call_command("import_memberships", str(team.pk), path, stdout=out, stderr=err)
+        self.assertIn(
+            "added 2, skipped 2 existing, 2 unmatched, 1 malformed rows.",
+            out.getvalue(),
+        )
+        self.assertIn("Row 6: invalid user_id", err.getvalue())
+        self.assertEquals(
+            sorted(team.invitees.values_list("user_id", flat=True)),
+            sorted(user.pk for user in users),
+        )
+
+
+class TeamSeekTests(BaseTeamTests):
+
+    def test_cursor_roundtrip(self):
+        team = self._create_team()
+        cursor = encode_cursor(team.created_at, team.pk)
+        self.assertEquals(decode_cursor(cursor), (team.created_at, team.pk))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor")
+
+    def test_seek_walks_all_teams(self):
+        teams = [self._create_team() for i in range(5)]
+        Team.objects.filter(pk__in=[t.pk for t in teams[:3]]).update(
+            created_at=teams[0].created_at
+        )
+        seen, cursor = [], None
+        while True:
+            page = list(Team.objects.seek(cursor)[:2])
+            if not page:
+                break
+            seen.extend(team.pk for team in page)
+            cursor = encode_cursor(page[-1].created_at, page[-1].pk)
+        self.assertEquals(sorted(seen), sorted(team.pk for team in teams))
+        self.assertEquals(len(seen), len(set(seen)))
+
+    def _export(self, **params):
+        request = RequestFactory().get(reverse("team_export"), params)
+        request.user = self.user
+        response = TeamExportView.as_view()(request)
+        return [json.loads(line) for line in
+                b"".join(response.streaming_content).decode("utf-8").splitlines()]
+
+    def test_export_streams_in_one_query(self):
+        for i in range(4):
+            self._create_team()
+        with self.assertNumQueries(1):
+            rows = self._export()
+        self.assertEquals(
+            [row["id"] for row in rows],
+            list(Team.objects.seek().values_list("id", flat=True)),
+        )
+        self.assertEquals(len(rows), 4)
+        self.assertEquals(self._export(after=rows[1]["cursor"]), rows[2:])
+
+    def test_views_reject_invalid_cursor(self):
+        for name, view in (("team_list", TeamListView), ("team_export", TeamExportView)):
+            request = RequestFactory().get(reverse(name), {"after": "not-a-cursor"})
+            request.user = self.user
+            self.assertEquals(view.as_view()(request).status_code, 400)
+
+
+class AvatarVariantTests(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def _upload(self, size=(800, 600), fmt="PNG"):
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", size, (200, 10, 10)).save(buf, fmt)
+        return self.storage.save("avatars/upload.png", ContentFile(buf.getvalue()))
+
+    def test_render_variants(self):
+        from PIL import Image
+        name = self._upload()
+        with self.settings(TEAM_AVATAR_SIZES={"small": 32, "medium": 100}):
+            variants = avatars.render_variants(self.storage, name)
+        self.assertEquals(sorted(variants), ["medium", "small"])
+        with self.storage.open(variants["small"]) as fp:
+            image = Image.open(fp)
+            self.assertEquals(image.size, (32, 32))
+            self.assertNotIn("exif", image.info)
+
+    def test_render_variants_pixel_limit(self):
+        name = self._upload()
+        with self.settings(TEAM_AVATAR_MAX_PIXELS=1000):
+            with self.assertRaises(ValueError):
+                avatars.render_variants(self.storage, name)
+
+    def test_avatar_url_prefers_variant(self):
+        team = Team(avatar="avatars/a.png")
+        self.assertTrue(team.small_avatar_url.endswith("avatars/a.png"))
+        team.avatar_variants = '{"small": "avatars/variants/a-64.jpg"}'
+        self.assertTrue(team.small_avatar_url.endswith("avatars/variants/a-64.jpg"))
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_identical_content_is_stored_once(self):
+        first = self.storage.save("avatars/one.png", ContentFile(b"logo"))
+        second = self.storage.save("avatars/two.PNG", ContentFile(b"logo"))
+        self.assertEquals(first, second)
+        self.assertTrue(first.startswith("avatars/"))
+        self.assertTrue(first.endswith(".png"))
+        self.assertEquals(len(list(self.storage.blobs("avatars"))), 1)
+
+    def test_names_are_sharded_digests(self):
+        name = self.storage.save("avatars/one.png", ContentFile(b"logo"))
+        digest = hashlib.sha256(b"logo").hexdigest()
+        self.assertEquals(
+            name, "avatars/%s/%s/%s.png" % (digest[:2], digest[2:4], digest)
+        )
+        with self.storage.open(name) as fp:
+            self.assertEquals(fp.read(), b"logo")
+
+    def test_blobs_are_world_readable(self):
+        name = self.storage.save("avatars/one.png", ContentFile(b"logo"))
+        self.assertEquals(os.stat(self.storage.path(name)).st_mode & 0o777, 0o644)
+
+    def test_saving_again_refreshes_mtime(self):
+        name = self.storage.save("avatars/one.png", ContentFile(b"logo"))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        self.storage.save("avatars/two.png", ContentFile(b"logo"))
+        self.assertGreater(os.path.getmtime(path), 0)
+
+
+class MembershipTransitionTests(BaseTeamTests):
+
+    def setUp(self):
+        super(MembershipTransitionTests, self).setUp()
+        self.team = self._create_team()
+        self.team.memberships.create(
+            user=self.user,
+            role=MembershipRole.OWNER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        self.paltman = User.objects.create_user(username="paltman")
+        self.membership = self.team.memberships.create(user=self.paltman)
+
+    def test_accept_is_one_update_plus_counters(self):
+        # TestCase adds a SAVEPOINT and RELEASE around the transition
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.assertTrue(self.membership.accept(self.user))
+        statements = [
+            query["sql"] for query in queries.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEquals(len(statements), 2)
+        self.assertIn('UPDATE "team_membership"', statements[0])
+        self.assertIn('UPDATE "team_team"', statements[1])
+        self.assertEquals(self.membership.status, MembershipStatus.ACCEPTED)
+        self.assertEquals(
+            Membership.objects.get(pk=self.membership.pk).status,
+            MembershipStatus.ACCEPTED,
+        )
+
+    def test_unauthorized_actor(self):
+        stranger = User.objects.create_user(username="stranger")
+        sent = []
+
+        def receiver(sender, membership, **kwargs):
+            sent.append(membership)
+
+        signals.accepted_membership.connect(receiver)
+        try:
+            self.assertFalse(self.membership.accept(stranger))
+        finally:
+            signals.accepted_membership.disconnect(receiver)
+        self.assertEquals(sent, [])
+        self.assertEquals(self.membership.status, MembershipStatus.APPLIED)
+
+    def test_manager_must_be_accepted(self):
+        invited = User.objects.create_user(username="invited")
+        self.team.memberships.create(
+            user=invited,
+            role=MembershipRole.MANAGER,
+            status=MembershipStatus.INVITED,
+        )
+        self.assertFalse(self.membership.accept(invited))
+        self.assertEquals(
+            Membership.objects.get(pk=self.membership.pk).status,
+            MembershipStatus.APPLIED,
+        )
+
+    def test_stale_instance_does_not_apply(self):
+        other = Membership.objects.get(pk=self.membership.pk)
+        self.assertTrue(self.membership.reject(self.user))
+        self.assertFalse(other.accept(self.user))
+        self.assertEquals(
+            Membership.objects.get(pk=self.membership.pk).status,
+            MembershipStatus.REJECTED,
+        )
+
+    def test_wrong_source_state_skips_query(self):
+        with self.assertNumQueries(0):
+            self.assertFalse(self.membership.demote(self.user))
+
+
+class ModerateApplicantsTests(BaseTeamTests):
+
+    def setUp(self):
+        super(ModerateApplicantsTests, self).setUp()
+        self.team = self._create_team()
+        self.team.memberships.create(
+            user=self.user,
+            role=MembershipRole.OWNER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        self.applicants = [
+            self.team.memberships.create(
+                user=User.objects.create_user(username="user%d" % i)
+            )
+            for i in range(3)
+        ]
+
+    def test_accept_applicants(self):
+        invited = self.team.memberships.create(
+            user=User.objects.create_user(username="invited"),
+            status=MembershipStatus.INVITED,
+        )
+        ids = [m.pk for m in self.applicants] + [invited.pk]
+        outcomes = self.team.accept_applicants(ids, self.user)
+        self.assertEquals(outcomes, dict(
+            [(m.pk, True) for m in self.applicants] + [(invited.pk, False)]
+        ))
+        self.assertEquals(self.team.acceptances.count(), 4)
+        team = Team.objects.get(pk=self.team.pk)
+        self.assertEquals(team.applied_count, 0)
+        self.assertEquals(team.member_count, 3)
+
+    def test_reject_applicants_sends_one_batch(self):
+        batches = []
+
+        def receiver(sender, memberships, **kwargs):
+            batches.append(memberships)
+
+        signals.rejected_memberships.connect(receiver)
+        try:
+            self.team.reject_applicants([m.pk for m in self.applicants], self.user)
+        finally:
+            signals.rejected_memberships.disconnect(receiver)
+        self.assertEquals(len(batches), 1)
+        self.assertEquals(self.team.rejections.count(), 3)
+
+    def test_bulk_accept_refreshes_cached_detail(self):
+        self.assertFalse(signals.accepted_memberships.has_listeners(self.team))
+        self.assertFalse(signals.accepted_membership.has_listeners())
+        request = RequestFactory().get(self.team.get_absolute_url())
+        request.user = AnonymousUser()
+        view = TeamDetailView.as_view()
+        detail = view(request, pk=str(self.team.pk)).context_data
+        self.assertEquals(detail["team"]["accepted_count"], 1)
+        self.team.accept_applicants([m.pk for m in self.applicants], self.user)
+        detail = view(request, pk=str(self.team.pk)).context_data
+        self.assertEquals(detail["team"]["accepted_count"], 4)
+        self.assertEquals(len(detail["roster"]), 4)
+
+    def test_requires_authority(self):
+        applicant = self.applicants[0]
+        outcomes = self.team.accept_applicants([applicant.pk], applicant.user)
+        self.assertEquals(outcomes, {applicant.pk: False})
+        self.assertEquals(self.team.applicants.count(), 3)
+
+    def test_requires_accepted_manager(self):
+        invited = User.objects.create_user(username="invited")
+        self.team.memberships.create(
+            user=invited,
+            role=MembershipRole.MANAGER,
+            status=MembershipStatus.INVITED,
+        )
+        ids = [m.pk for m in self.applicants]
+        outcomes = self.team.reject_applicants(ids, invited)
+        self.assertEquals(outcomes, dict.fromkeys(ids, False))
+        self.assertEquals(self.team.applicants.count(), 3)
+
+
+class OutboxTests(BaseTeamTests):
+
+    def setUp(self):
+        super(OutboxTests, self).setUp()
+        self.team = self._create_team()
+        self.team.memberships.create(
+            user=self.user,
+            role=MembershipRole.OWNER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        self.received = []
+        self.failing = False
+        signals.promoted_member.connect(self.receiver)
+
+    def tearDown(self):
+        signals.promoted_member.disconnect(self.receiver)
+
+    def receiver(self, sender, membership, **kwargs):
+        if self.failing:
+            raise RuntimeError("receiver down")
+        self.received.append(membership.pk)
+
+    def _member(self, username):
+        return self.team.memberships.create(
+            user=User.objects.create_user(username=username),
+            status=MembershipStatus.ACCEPTED,
+        )
+
+    def test_async_dispatch_goes_through_outbox(self):
+        membership = self._member("paltman")
+        with self.settings(TEAM_SIGNAL_DISPATCH="async"):
+            self.assertTrue(membership.promote(self.user))
+        self.assertEquals(self.received, [])
+        self.assertEquals(OutboxEvent.objects.get().team_id, self.team.pk)
+
+        self.assertEquals(outbox.drain(), (1, 0, 0))
+        self.assertEquals(self.received, [membership.pk])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failed_event_blocks_later_events_of_team(self):
+        first, second = self._member("first"), self._member("second")
+        with self.settings(TEAM_SIGNAL_DISPATCH="async"):
+            first.promote(self.user)
+            second.promote(self.user)
+
+        self.failing = True
+        self.assertEquals(outbox.drain(), (0, 1, 0))
+        self.failing = False
+        # the retry is not due yet, so the team's second event waits too
+        self.assertEquals(outbox.drain(), (0, 0, 0))
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        self.assertEquals(outbox.drain(), (2, 0, 0))
+        self.assertEquals(self.received, [first.pk, second.pk])
+
+    def test_async_bulk_moderation_records_events_without_receivers(self):
+        applicant = self.team.memberships.create(
+            user=User.objects.create_user(username="applicant")
+        )
+        with self.settings(TEAM_SIGNAL_DISPATCH="async"):
+            self.team.accept_applicants([applicant.pk], self.user)
+        self.assertEquals(
+            sorted(OutboxEvent.objects.values_list("signal", flat=True)),
+            ["accepted_membership", "accepted_memberships"],
+        )
+
+    def test_gives_up_after_max_attempts(self):
+        with self.settings(TEAM_SIGNAL_DISPATCH="async"):
+            self._member("other").promote(self.user)
+        self.failing = True
+        self.assertEquals(outbox.drain(max_attempts=1), (0, 0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertTrue(event.failed)
+        self.assertIn("receiver down", event.last_error)
+
+
+class EstimatedCountPaginatorTests(BaseTeamTests):
+
+    def test_unfiltered_count_uses_pk_range(self):
+        teams = [self._create_team() for i in range(3)]
+        teams[1].delete()
+        paginator = EstimatedCountPaginator(Team.objects.order_by("-pk"), 2)
+        with self.assertNumQueries(1):
+            self.assertEquals(paginator.count, 3)
+        self.assertEquals(paginator.num_pages, 2)
+
+    def test_filtered_count_is_capped(self):
+        for i in range(3):
+            self._create_team()
+        paginator = EstimatedCountPaginator(Team.objects.filter(name="xxxz"), 2)
+        paginator.count_limit = 2
+        self.assertEquals(paginator.count, 2)
+
+
+class NameBlacklistTests(TestCase):
+
+    def setUp(self):
+        self.blacklist = blacklist.NameBlacklist(["Admin", "root"])
+
+    def test_normalize_folds_case_accents_and_confusables(self):
+        self.assertEquals(blacklist.normalize(u"\u0410dm\u00ecn!"), u"admini")
+        self.assertEquals(blacklist.normalize(u"R00T"), u"root")
+        self.assertEquals(blacklist.normalize(u"ro-ot "), u"root")
+
+    def test_exact_and_substring_matches(self):
+        self.assertTrue(self.blacklist.matches("admin"))
+        self.assertTrue(self.blacklist.matches("The ADM1N team"))
+        self.assertTrue(self.blacklist.matches(u"\u0440\u043e\u043ekit r00t"))
+        self.assertFalse(self.blacklist.matches("Pinax"))
+        self.assertFalse(self.blacklist.matches("ro ad"))
+
+    def test_reload_reads_file(self):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(b"# reserved\nsuperuser\n\n")
+        with self.settings(TEAM_NAME_BLACKLIST=("root",), TEAM_NAME_BLACKLIST_FILE=path):
+            compiled = blacklist.reload()
+        self.addCleanup(blacklist.reload)
+        self.assertEquals(compiled.entries, frozenset(["root", "superuser"]))
+        self.assertTrue(compiled.matches("SuperUsers"))
+
+
+class TeamSearchTests(BaseTeamTests):
+
+    def _team(self, name, description="", public_visible=True):
+        return Team.objects.create(
+            name=name,
+            description=description,
+            public_visible=public_visible,
+            creator=self.user,
+        )
+
+    def _names(self, query, user=None):
+        return [team.name for team in search.search_teams(query, user or self.user)]
+
+    def test_match_expression(self):
+        self.assertEquals(search.match_expression(u"pinax te"), u'"pinax" "te"*')
+        self.assertEquals(search.match_expression(u"pinax t"), u'"pinax" "t"')
+        self.assertIsNone(search.match_expression(u" *\"- "))
+
+    def test_prefix_search_ranks_name_hits_first(self):
+        self._team("Gardening club", "We talk about pinax")
+        self._team("Pinax core")
+        self._team("Unrelated")
+        self.assertEquals(self._names("pin"), ["Pinax core", "Gardening club"])
+        self.assertEquals(self._names("pinax cor"), ["Pinax core"])
+        self.assertEquals(self._names("  "), [])
+
+    def test_private_teams_are_only_found_by_members(self):
+        team = self._team("Secret pinax", public_visible=False)
+        paltman = User.objects.create_user(username="paltman")
+        self.assertEquals(self._names("pinax", paltman), [])
+        team.memberships.create(
+            user=paltman, role=MembershipRole.MEMBER, status=MembershipStatus.INVITED
+        )
+        self.assertEquals(self._names("pinax", paltman), [])
+        team.memberships.filter(user=paltman).update(status=MembershipStatus.ACCEPTED)
+        self.assertEquals(self._names("pinax", paltman), ["Secret pinax"])
+
+    def test_index_follows_updates_and_deletes(self):
+        team = self._team("Pinax core")
+        team.name = "Symposion"
+        team.save()
+        self.assertEquals(self._names("pinax"), [])
+        self.assertEquals(self._names("sympo"), ["Symposion"])
+        team.delete()
+        self.assertEquals(self._names("sympo"), [])
+
+    def test_repair_restores_what_a_table_rebuild_drops(self):
+        connection = connections["default"]
+        if not search.is_installed(connection):
+            self.skipTest("SQLite without FTS5")
+        with connection.cursor() as cursor:
+            for name in search.TRIGGERS:
+                cursor.execute("DROP TRIGGER %s" % name.format(fts=search.FTS_TABLE))
+            cursor.execute("DROP INDEX %s" % schema.NAME_INDEX)
+        self._team("Pinax core")
+        self.assertEquals(
+            sorted(schema.repair(connection)), [search.FTS_TABLE, schema.NAME_INDEX]
+        )
+        self.assertEquals(schema.repair(connection), [])
+        self.assertEquals(self._names("pin"), ["Pinax core"])
+        self._team("Pinax symposion")
+        self.assertEquals(self._names("sympo"), ["Pinax symposion"])
+
+
+class UserIndexTests(TestCase):
+
+    def test_prefix_lookup(self):
+        index = autocomplete.UserIndex([
+            (1, "Paltman"),
+            (2, "baohua"),
+            (3, "brosner"),
+        ])
+        self.assertEquals(list(index.prefixed("pa")), [(1, "Paltman")])
+        self.assertEquals(list(index.prefixed("B")), [(2, "baohua"), (3, "brosner")])
+        index.add(3, "pbrosner")
+        index.remove(2)
+        self.assertEquals(list(index.prefixed("p")), [(1, "Paltman"), (3, "pbrosner")])
+        self.assertEquals(index.max_pk, 3)
+
+
+class UsersToInviteTests(BaseTeamTests):
+
+    def setUp(self):
+        super(UsersToInviteTests, self).setUp()
+        autocomplete.rebuild()
+        self.team = self._create_team()
+
+    def _usernames(self, prefix, **kwargs):
+        return [
+            username for pk, username
+            in autocomplete.users_to_invite(self.team, prefix, **kwargs)
+        ]
+
+    def test_excludes_members_and_invitees(self):
+        for username in ["pa1", "pa2", "pa3", "pa4"]:
+            User.objects.create_user(username=username)
+        self.team.memberships.create(
+            user=User.objects.get(username="pa1"),
+            role=MembershipRole.MEMBER, status=MembershipStatus.ACCEPTED,
+        )
+        self.team.add_user(User.objects.get(username="pa2"), MembershipRole.MEMBER)
+        self.team.memberships.create(
+            user=User.objects.get(username="pa3"),
+            role=MembershipRole.MEMBER, status=MembershipStatus.DECLINED,
+        )
+        self.assertEquals(self._usernames("PA", batch_size=1), ["pa3", "pa4"])
+        self.assertEquals(self._usernames("pa", limit=1), ["pa3"])
+        self.assertEquals(self._usernames(""), [])
+
+    def test_index_follows_user_changes(self):
+        user = User.objects.create_user(username="paltman", email="pat@example.com")
+        self.assertEquals(self._usernames("pal"), ["paltman"])
+        self.assertEquals(self._usernames("pat@"), [])
+        user.username = "patrick"
+        user.save()
+        self.assertEquals(self._usernames("pal"), [])
+        self.assertEquals(self._usernames("patr"), ["patrick"])
+        user.is_active = False
+        user.save()
+        self.assertEquals(self._usernames("pat"), [])
+
+    def test_endpoint_is_for_managers(self):
+        paltman = User.objects.create_user(username="paltman")
+        User.objects.create_user(username="pinax")
+        view = TeamAutocompleteUsersView.as_view()
+        request = RequestFactory().get(
+            reverse("team_autocomplete_users", args=[self.team.pk]), {"q": "pi"}
+        )
+        request.user = paltman
+        self.assertEquals(view(request, pk=str(self.team.pk)).status_code, 403)
+        self.team.memberships.create(
+            user=paltman, role=MembershipRole.MANAGER, status=MembershipStatus.ACCEPTED,
+        )
+        response = view(request, pk=str(self.team.pk))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(
+            json.loads(response.content.decode("utf-8"))["results"],
+            [{"id": User.objects.get(username="pinax").pk, "username": "pinax"}],
+        )
+
+
+class TeamCacheTests(BaseTeamTests):
+
+    def setUp(self):
+        super(TeamCacheTests, self).setUp()
+        self.calls = 0
+
+    def _compute(self):
+        self.calls += 1
+        return {"calls": self.calls}
+
+    def test_computes_once_per_version(self):
+        team = self._create_team()
+        self.assertEquals(cache.get_or_compute(team.pk, "x", self._compute), {"calls": 1})
+        self.assertEquals(cache.get_or_compute(team.pk, "x", self._compute), {"calls": 1})
+        cache.bump(team.pk)
+        self.assertEquals(cache.get_or_compute(team.pk, "x", self._compute), {"calls": 2})
+
+    def test_team_and_membership_changes_bump_the_version(self):
+        team = self._create_team()
+        version = cache.get_version(team.pk)
+        team.save()
+        self.assertNotEqual(cache.get_version(team.pk), version)
+        version = cache.get_version(team.pk)
+        team.add_user(User.objects.create_user(username="paltman"), MembershipRole.MEMBER)
+        self.assertNotEqual(cache.get_version(team.pk), version)
+
+
+class TeamDetailViewTests(BaseTeamTests):
+
+    def _detail(self, team, user=None):
+        request = RequestFactory().get(team.get_absolute_url())
+        request.user = user or AnonymousUser()
+        return TeamDetailView.as_view()(request, pk=str(team.pk))
+
+    def test_roster_is_cached_until_membership_changes(self):
+        team = self._create_team()
+        paltman = User.objects.create_user(username="paltman")
+        team.memberships.create(
+            user=self.user, role=MembershipRole.OWNER, status=MembershipStatus.ACCEPTED
+        )
+        self.assertTrue(team.get_absolute_url().endswith("/%d/" % team.pk))
+        response = self._detail(team)
+        self.assertEquals(
+            [member["username"] for member in response.context_data["roster"]],
+            ["baohua"],
+        )
+        with self.assertNumQueries(0):
+            self._detail(team)
+        membership = team.memberships.create(
+            user=paltman, role=MembershipRole.MEMBER, status=MembershipStatus.APPLIED
+        )
+        membership.accept(self.user)
+        response = self._detail(team)
+        self.assertEquals(
+            [member["username"] for member in response.context_data["roster"]],
+            ["baohua", "paltman"],
+        )
+
+    def test_private_team_is_hidden_from_non_members(self):
+        team = self._create_team()
+        team.public_visible = False
+        team.save()
+        with self.assertRaises(Http404):
+            self._detail(team)
+        team.memberships.create(
+            user=self.user, role=MembershipRole.OWNER, status=MembershipStatus.ACCEPTED
+        )
+        self.assertEquals(self._detail(team, self.user).context_data["team"]["name"], "xxxz")
+
+
+class MembershipMatrixTests(BaseTeamTests):
+
+    def setUp(self):
+        super(MembershipMatrixTests, self).setUp()
+        self.team = self._create_team()
+        self.other = self._create_team()
+        self.paltman = User.objects.create_user(username="paltman")
+        self.team.memberships.create(
+            user=self.user, role=MembershipRole.OWNER, status=MembershipStatus.ACCEPTED
+        )
+        self.other.memberships.create(
+            user=self.paltman, role=MembershipRole.MEMBER, status=MembershipStatus.AUTO_JOINED
+        )
+        self.team.memberships.create(
+            user=self.paltman, role=MembershipRole.MEMBER, status=MembershipStatus.APPLIED
+        )
+        self.pairs = [
+            [self.user.pk, self.team.pk],
+            [self.paltman.pk, self.team.pk],
+            [self.paltman.pk, self.other.pk],
+        ]
+
+    def test_one_query_for_all_pairs(self):
+        with self.assertNumQueries(1):
+            found = membership_matrix(self.pairs)
+        self.assertEquals(found, {
+            (self.user.pk, self.team.pk): (MembershipRole.OWNER, MembershipStatus.ACCEPTED),
+            (self.paltman.pk, self.other.pk): (MembershipRole.MEMBER, MembershipStatus.AUTO_JOINED),
+        })
+
+    def test_chunks(self):
+        with self.assertNumQueries(2):
+            self.assertEquals(len(membership_matrix(self.pairs, chunk_size=2)), 2)
+
+    @override_settings(TEAM_AUTHZ_ALLOWED_IPS=("127.0.0.1",))
+    def test_endpoint_revalidates_with_etag(self):
+        url = reverse("team_authz")
+        body = json.dumps({"pairs": self.pairs})
+        response = self.client.post(url, body, content_type="application/json")
+        self.assertEquals(json.loads(response.content.decode("utf-8"))["matrix"], [
+            [MembershipRole.OWNER, MembershipStatus.ACCEPTED],
+            None,
+            [MembershipRole.MEMBER, MembershipStatus.AUTO_JOINED],
+        ])
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                url, body, content_type="application/json", HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEquals(response.status_code, 304)
+
+        Membership.objects.get(user=self.paltman, team=self.team).accept(self.user)
+        response = self.client.post(
+            url, body, content_type="application/json", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(TEAM_AUTHZ_ALLOWED_IPS=("127.0.0.1",))
+    def test_endpoint_revalidates_after_cascading_delete(self):
+        url = reverse("team_authz")
+        body = json.dumps({"pairs": self.pairs})
+        etag = self.client.post(url, body, content_type="application/json")["ETag"]
+        version = cache.get_version(self.other.pk)
+
+        self.paltman.delete()
+        self.assertNotEqual(cache.get_version(self.other.pk), version)
+        response = self.client.post(
+            url, body, content_type="application/json", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(json.loads(response.content.decode("utf-8"))["matrix"], [
+            [MembershipRole.OWNER, MembershipStatus.ACCEPTED], None, None,
+        ])
+
+    def test_endpoint_is_restricted(self):
+        response = self.client.post(
+            reverse("team_authz"), json.dumps({"pairs": []}), content_type="application/json"
+        )
+        self.assertEquals(response.status_code, 403)
+
+    @override_settings(TEAM_AUTHZ_ALLOWED_IPS=("127.0.0.1",))
+    def test_endpoint_rejects_proxied_requests(self):
+        response = self.client.post(
+            reverse("team_authz"), json.dumps({"pairs": self.pairs}),
+            content_type="application/json", HTTP_X_FORWARDED_FOR="203.0.113.7",
+        )
+        self.assertEquals(response.status_code, 403)
+
+
+class TeamRosterTests(BaseTeamTests):
+
+    def setUp(self):
+        super(TeamRosterTests, self).setUp()
+        self.team = self._create_team()
+        self.team.memberships.create(
+            user=self.user, role=MembershipRole.OWNER, status=MembershipStatus.ACCEPTED
+        )
+        for i in range(4):
+            self.team.memberships.create(
+                user=User.objects.create_user(username="user%d" % i),
+                role=MembershipRole.MEMBER,
+                status=MembershipStatus.ACCEPTED if i % 2 else MembershipStatus.APPLIED,
+            )
+
+    def test_roster_entries(self):
+        with self.assertNumQueries(1):
+            entries = list(self.team.roster())
+        self.assertEquals(
+            [(entry.username, entry.role) for entry in entries],
+            [("baohua", MembershipRole.OWNER), ("user1", MembershipRole.MEMBER),
+             ("user3", MembershipRole.MEMBER)],
+        )
+        self.assertEquals(
+            [entry.username for entry in self.team.roster(roles=[MembershipRole.MEMBER])],
+            ["user1", "user3"],
+        )
+
+    def test_roster_chunks(self):
+        with self.assertNumQueries(2):
+            self.assertEquals(len(list(self.team.roster(chunk_size=2))), 3)
+
+    def _export(self, user, **params):
+        request = RequestFactory().get(reverse("team_roster", args=[self.team.pk]), params)
+        request.user = user
+        return TeamRosterExportView.as_view()(request, pk=str(self.team.pk))
+
+    def test_export(self):
+        self.assertEquals(self._export(AnonymousUser()).status_code, 403)
+        response = self._export(self.user)
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEquals(lines[0], "user_id,username,role,status,joined_at")
+        self.assertEquals(len(lines), 4)
+        response = self._export(self.user, format="ndjson")
+        rows = [json.loads(line) for line in
+                b"".join(response.streaming_content).decode("utf-8").splitlines()]
+        self.assertEquals([row["username"] for row in rows], ["baohua", "user1", "user3"])
+
+    def test_export_non_ascii_username(self):
+        self.team.memberships.create(
+            user=User.objects.create_user(username=u"j\u00fcrgen"),
+            role=MembershipRole.MEMBER,
+            status=MembershipStatus.ACCEPTED,
+        )
+        response = self._export(self.user)
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEquals(len(lines), 5)
+        self.assertIn(u",j\u00fcrgen,", lines[4])
+
+
+class TeamDumpTests(BaseTeamTests):
+
+    def test_roundtrip(self):
+        team = self._create_team()
+        team.memberships.create(
+            user=self.user, role=MembershipRole.OWNER, status=MembershipStatus.ACCEPTED
+        )
+        created_at = Team.objects.get(pk=team.pk).created_at
+        lines = []
+        counts = dumps.dump(lines.append, chunk_size=1)
+        self.assertEquals(counts["team.membership"], 1)
+
+        with self.assertRaises(ValueError):
+            dumps.load(lines)
+        counts = dumps.load(lines, chunk_size=1, replace=True)
+        self.assertEquals(counts, {"team.invitation": 0, "team.team": 1, "team.membership": 1})
+        restored = Team.objects.get(pk=team.pk)
+        self.assertEquals(restored.created_at, created_at)
+        self.assertEquals(restored.role_for(self.user), MembershipRole.OWNER)
+        # the sequence continues after the restored ids
+        self.assertGreater(self._create_team().pk, team.pk)
+
+    def test_load_bumps_restored_teams(self):
+        team = self._create_team()
+        lines = []
+        dumps.dump(lines.append)
+        version = cache.get_version(team.pk)
+        dumps.load(lines, replace=True)
+        self.assertNotEqual(cache.get_version(team.pk), version)
+
+    def test_malformed_dumps(self):
+        header = json.dumps(dumps.FORMAT) + "\n"
+        for lines in [[], [header, "[1]\n"], [header, '{"model": "auth.user", "fields": []}\n']]:
+            with self.assertRaises(ValueError):
+                dumps.load(lines)
+
+    def test_missing_users_are_reported(self):
+        team = self._create_team()
+        paltman = User.objects.create_user(username="paltman")
+        team.memberships.create(
+            user=paltman, role=MembershipRole.MEMBER, status=MembershipStatus.ACCEPTED
+        )
+        lines = []
+        dumps.dump(lines.append)
+        paltman_pk = paltman.pk
+        Membership.objects.all().delete()
+        paltman.delete()
+        with self.assertRaises(ValueError) as raised:
+            dumps.load(lines, replace=True)
+        self.assertIn("ids %d" % paltman_pk, str(raised.exception))
+        # nothing was loaded
+        self.assertFalse(Membership.objects.exists())
+
+
+class ShardingTests(BaseTeamTests):
+
+    multi_db = True
+
+    def test_unsharded(self):
+        self.assertEquals(sharding.shards(), ["default"])
+        self.assertIsNone(sharding.shard_for(1))
+        self.assertIsNone(sharding.TeamShardRouter().db_for_read(Team, instance=Team(pk=1)))
+
+    @override_settings(TEAM_SHARDS=["a", "b"])
+    def test_router(self):
+        router = sharding.TeamShardRouter()
+        self.assertEquals(sharding.shard_for(3), "b")
+        self.assertEquals(router.db_for_read(Team, instance=Team(pk=4)), "a")
+        self.assertEquals(router.db_for_write(Membership, instance=Membership(team_id=5)), "b")
+        self.assertIsNone(router.db_for_read(Membership, instance=self.user))
+        self.assertIsNone(router.db_for_read(User, instance=self.user))
+        self.assertTrue(router.allow_migrate("a", "team"))
+        self.assertFalse(router.allow_migrate("a", "auth"))
+        self.assertFalse(router.allow_migrate("replica", "team"))
+        self.assertIsNone(router.allow_migrate("default", "auth"))
+
+    @override_settings(TEAM_SHARDS=["default", "team_1"], TEAM_SIGNAL_DISPATCH="async")
+    def test_teams_across_shards(self):
+        # users are only ever created on default
+        paltman = User.objects.create_user(username="paltman")
+        first = self._create_team()
+        second = self._create_team()
+        self.assertEquals(second.pk, first.pk + 1)
+        self.assertFalse(TeamSequence.objects.exists())
+        for team in [first, second]:
+            team.memberships.create(
+                user=self.user, role=MembershipRole.OWNER, status=MembershipStatus.ACCEPTED
+            )
+            team.add_user(paltman, MembershipRole.MEMBER)
+
+        for team in [first, second]:
+            using = sharding.shard_for(team.pk)
+            other = "team_1" if using == "default" else "default"
+            for model in [Team, Membership, OutboxEvent]:
+                field = "pk" if model is Team else "team_id"
+                rows = model._default_manager.filter(**{field: team.pk})
+                self.assertTrue(rows.using(using).exists())
+                self.assertFalse(rows.using(other).exists())
+            team = Team.objects.using(using).get(pk=team.pk)
+            self.assertEquals([entry.username for entry in team.roster()], ["baohua"])
+            self.assertEquals(
+                [entry.username for entry in team.roster(statuses=[MembershipStatus.INVITED])],
+                ["paltman"],
+            )
+            detail = load_team_detail(team.pk)
+            self.assertEquals(detail["team"]["accepted_count"], 1)
+            self.assertEquals([member["username"] for member in detail["roster"]], ["baohua"])
+
+        teams = Team.objects.seek().across_shards(3)
+        self.assertEquals([team.pk for team in teams], [second.pk, first.pk])
+        teams = Team.objects.joined_by(self.user).order_by("pk").across_shards()
+        self.assertEquals([team.pk for team in teams], [first.pk, second.pk])
+        self.assertEquals(membership_matrix([
+            (self.user.pk, first.pk), (self.user.pk, second.pk), (paltman.pk, second.pk),
+        ]), {
+            (self.user.pk, first.pk): (MembershipRole.OWNER, MembershipStatus.ACCEPTED),
+            (self.user.pk, second.pk): (MembershipRole.OWNER, MembershipStatus.ACCEPTED),
+        })
+
+    def test_migrate_new_shard(self):
+        alias = "team_2"
+        connections.databases[alias] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        }
+
+        def remove_alias():
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        self.addCleanup(remove_alias)
+
+        with self.settings(TEAM_SHARDS=["default", "team_1", alias]):
+            call_command("migrate", database=alias, interactive=False, verbosity=0)
+        tables = connections[alias].introspection.table_names()
+        self.assertIn("team_team", tables)
+        self.assertIn("team_membership", tables)
+        self.assertNotIn("auth_user", tables)
+
+
+class MetricsTests(TestCase):
+
+    def test_fingerprint_ignores_literals(self):
+        digest, sql = metrics.fingerprint(
+            "SELECT * FROM team_team WHERE id IN (1, 2, 3) AND name = 'it''s'"
+        )
+        self.assertEquals(sql, "SELECT * FROM team_team WHERE id IN (...) AND name = ?")
+        self.assertEquals(
+            metrics.fingerprint("SELECT * FROM team_team WHERE id IN (4) AND name = 'x'"),
+            (digest, sql),
+        )
+        self.assertNotEqual(
+            metrics.fingerprint("SELECT * FROM team_membership WHERE id = 1")[0], digest
+        )
+
+    def test_histogram_buckets(self):
+        histogram = metrics.Histogram("h", "Test.", (1, 5))
+        for value in [0.5, 3, 7]:
+            histogram.observe(("v",), value)
+        self.assertEquals(list(histogram.lines(("view",))), [
+            ("h_bucket", [("view", "v"), ("le", "1.0")], 1),
+            ("h_bucket", [("view", "v"), ("le", "5.0")], 2),
+            ("h_bucket", [("view", "v"), ("le", "+Inf")], 3),
+            ("h_sum", [("view", "v")], 10.5),
+            ("h_count", [("view", "v")], 3),
+        ])
+
+    def test_merges_worker_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.Registry()
+        other.record("team_list", 0.2, 0.05, 3, {("abc", "SELECT ?"): 1})
+        with open(os.path.join(directory, "999999.json"), "w") as fp:
+            json.dump(other.snapshot(), fp)
+        own = metrics.Registry()
+        own.record("team_list", 0.02, 0.01, 1, {})
+        with self.settings(METRICS_DIR=directory):
+            output = own.render(metrics._worker_snapshots())
+            self.assertIn('django_db_queries_count{view="team_list"} 2\n', output)
+            self.assertIn('django_db_queries_sum{view="team_list"} 4\n', output)
+            self.assertIn(
+                'django_duplicate_queries_total{view="team_list",fingerprint="abc",sql="SELECT ?"} 1\n',
+                output,
+            )
+            # a retired worker's totals stay, counters must not go backwards
+            metrics.retire_worker(999999)
+            self.assertEquals(
+                sorted(os.listdir(directory)), [metrics.ARCHIVE, metrics.LOCK]
+            )
+            self.assertEquals(own.render(metrics._worker_snapshots()), output)
+
+    @override_settings(METRICS_ALLOWED_IPS=("127.0.0.1",))
+    def test_view_rejects_proxied_requests(self):
+        factory = RequestFactory()
+        request = factory.get("/metrics/", REMOTE_ADDR="127.0.0.1")
+        self.assertEquals(metrics.metrics_view(request).status_code, 200)
+        request = factory.get(
+            "/metrics/", REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.7"
+        )
+        with self.assertRaises(Http404):
+            metrics.metrics_view(request)
+        with self.assertRaises(Http404):
+            metrics.metrics_view(factory.get("/metrics/", REMOTE_ADDR="203.0.113.7"))
@@ -1,15 +1,28 @@
 # -*- coding: UTF-8 -*-
 
 from django.conf.urls import url
-from .views import TeamCreateView, TeamListView
+from .views import (
+    TeamAuthorizationView,
+    TeamAutocompleteUsersView,
+    TeamCreateView,
+    TeamDetailView,
+    TeamExportView,
+    TeamListView,
+    TeamRosterExportView,
+    TeamSearchView,
+)
 
 urlpatterns = [
     # overall
     url(r"^$", TeamListView.as_view(), name="team_list"),
     url(r"^create/$", TeamCreateView.as_view(), name="team_create"),
+    url(r"^export/$", TeamExportView.as_view(), name="team_export"),
+    url(r"^search/$", TeamSearchView.as_view(), name="team_search"),
+    url(r"^authz/$", TeamAuthorizationView.as_view(), name="team_authz"),
 
     # team specific
-##    url(r"^(?P<pk>\d+)/$", "team_detail", name="team_detail"),
+    url(r"^(?P<pk>\d+)/$", TeamDetailView.as_view(), name="team_detail"),
+    url(r"^(?P<pk>\d+)/roster/$", TeamRosterExportView.as_view(), name="team_roster"),
 ##    url(r"^(?P<pk>\d+)/join/$", "team_join", name="team_join"),
 ##    url(r"^(?P<pk>\d+)/leave/$", "team_leave", name="team_leave"),
 ##    url(r"^(?P<pk>\d+)/apply/$", "team_apply", name="team_apply"),
@@ -17,7 +30,7 @@ urlpatterns = [
 ##    url(r"^(?P<pk>\d+)/manage/$", "team_manage", name="team_manage"),
 
     # membership specific
-##    url(r"^(?P<pk>\d+)/ac/users-to-invite/$", "autocomplete_users", name="team_autocomplete_users"),  # noqa
+    url(r"^(?P<pk>\d+)/ac/users-to-invite/$", TeamAutocompleteUsersView.as_view(), name="team_autocomplete_users"),  # noqa
 ##    url(r"^(?P<pk>\d+)/invite-user/$", "team_invite", name="team_invite"),
 ##    url(r"^(?P<pk>\d+)/members/(?P<pk>\d+)/revoke-invite/$", "team_member_revoke_invite", name="team_member_revoke_invite"),  # noqa
 ##    url(r"^(?P<pk>\d+)/members/(?P<pk>\d+)/resend-invite/$", "team_member_resend_invite", name="team_member_resend_invite"),  # noqa
@@ -1,10 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-from django.shortcuts import render
-from django.views.generic import CreateView, ListView
-from .models import Team, Membership
+import csv
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, render
+from django.utils import six
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import CreateView, ListView, TemplateView, View
+from . import autocomplete, avatars, cache, sharding
+from .models import Team, Membership, MembershipStatus, membership_matrix
 from .forms import TeamForm
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .search import MAX_RESULTS, search_teams
 
 class TeamCreateView(CreateView):
 
@@ -15,8 +36,314 @@ class TeamCreateView(CreateView):
         self.object = form.save(commit=False)
         self.object.creator = self.request.user
         self.object.save()
+        avatars.schedule(self.object)
         return HttpResponseRedirect(self.get_success_url())
 
+def load_team_detail(team_id, roster_size=100):
+    """
+    Returns the public fields of the team and the first ``roster_size`` of
+    its accepted members (owners, then managers, then members) as plain data
+    for the cache, or an empty dict when there is no such team.
+    """
+    using = sharding.shard_for(team_id)
+    team = Team.objects.using(using).filter(pk=team_id).first()
+    if team is None:
+        return {}
+    roster = Membership.objects.using(using).filter(
+        team_id=team_id, status__in=MembershipStatus.ACCEPTED_STATUSES
+    ).order_by("-role", "pk")
+    if sharding.is_sharded():
+        # the users are not on the team's shard
+        roster = list(roster.values_list("user_id", "role")[:roster_size])
+        names = sharding.usernames(user_id for user_id, role in roster)
+        roster = [(user_id, names.get(user_id), role) for user_id, role in roster]
+    else:
+        roster = roster.values_list("user_id", "user__username", "role")[:roster_size]
+    return {
+        "team": {
+            "id": team.pk,
+            "name": team.name,
+            "description": team.description,
+            "avatar_url": team.small_avatar_url,
+            "scope": team.scope,
+            "public_visible": team.public_visible,
+            "created_at": team.created_at,
+            "accepted_count": team.accepted_count,
+            "manager_count": team.manager_count,
+            "owner_count": team.owner_count,
+        },
+        "roster": [
+            {"user_id": user_id, "username": username, "role": role}
+            for user_id, username, role in roster
+        ],
+    }
+
+class TeamDetailView(TemplateView):
+    """
+    Serves the team page from ``team.cache``; only private teams cost a query
+    per request, to check that the viewer is on the team.
+    """
+
+    template_name = "team/team_detail.html"
+
+    def get_context_data(self, **kwargs):
+        context = super(TeamDetailView, self).get_context_data(**kwargs)
+        team_id = int(self.kwargs["pk"])
+        detail = cache.get_or_compute(
+            team_id, "detail", lambda: load_team_detail(team_id)
+        )
+        if not detail:
+            raise Http404("No such team")
+        if not detail["team"]["public_visible"] and not Membership.objects.using(
+            sharding.shard_for(team_id)
+        ).filter(
+            team_id=team_id,
+            user_id=getattr(self.request.user, "pk", None),
+            status__in=MembershipStatus.ACCEPTED_STATUSES,
+        ).exists():
+            raise Http404("No such team")
+        context.update(detail)
+        return context
+
 class TeamListView(ListView):
 
-    model = Team
\ No newline at end of file
+    model = Team
+    paginate_by = 25
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.GET.get("after")
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("Invalid cursor")
+        return super(TeamListView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Team.objects.with_membership_for(
+            self.request.user
+        ).seek(self.request.GET.get("after"))
+
+    def paginate_queryset(self, queryset, page_size):
+        # keyset pagination: fetch one extra row to know whether there is more
+        teams = queryset.across_shards(page_size + 1)
+        self.next_cursor = None
+        if len(teams) > page_size:
+            last = teams[page_size - 1]
+            self.next_cursor = encode_cursor(last.created_at, last.pk)
+        return (None, None, teams[:page_size], self.next_cursor is not None)
+
+    def get_context_data(self, **kwargs):
+        context = super(TeamListView, self).get_context_data(**kwargs)
+        context["next_cursor"] = self.next_cursor
+        return context
+
+class TeamExportView(View):
+    """
+    Streams public teams as JSON lines, newest first. Each line carries a
+    ``cursor`` that can be passed back as ``?after=`` to resume.
+    """
+
+    chunk_size = 1000
+    fields = [
+        "id",
+        "name",
+        "description",
+        "avatar",
+        "scope",
+        "created_at",
+        "accepted_count",
+    ]
+
+    def get(self, request):
+        cursor = request.GET.get("after")
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("Invalid cursor")
+        return StreamingHttpResponse(
+            self.stream(cursor),
+            content_type="application/x-ndjson",
+        )
+
+    def stream(self, cursor):
+        if not sharding.is_sharded():
+            # a single query, read from the database cursor as it goes
+            rows = Team.objects.filter(public_visible=True).seek(
+                cursor
+            ).values(*self.fields)
+            for row in rows.iterator():
+                yield self.line(row)
+            return
+        while True:
+            rows = Team.objects.filter(public_visible=True).seek(
+                cursor
+            ).values(*self.fields)
+            count = 0
+            for row in rows.across_shards(self.chunk_size):
+                count += 1
+                line = self.line(row)
+                cursor = row["cursor"]
+                yield line
+            if count < self.chunk_size:
+                break
+
+    def line(self, row):
+        row["cursor"] = encode_cursor(row["created_at"], row["id"])
+        return json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+class TeamSearchView(View):
+    """
+    ``?q=`` searches team names and descriptions, the last word as a prefix,
+    and returns the best matches the user may see as JSON.
+    """
+
+    fields = ["id", "name", "description", "public_visible"]
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get("limit", 20))
+        except ValueError:
+            return HttpResponseBadRequest("Invalid limit")
+        query = request.GET.get("q", "")
+        limit = max(1, min(limit, MAX_RESULTS))
+        if sharding.is_sharded():
+            teams = self.search_shards(query, request.user, limit)
+        else:
+            teams = search_teams(query, request.user, limit=limit)
+        return JsonResponse({
+            "results": [
+                dict((field, getattr(team, field)) for field in self.fields)
+                for team in teams
+            ],
+        })
+
+    def search_shards(self, query, user, limit):
+        # bm25 ranks come from per-shard statistics, close enough to merge
+        results = sharding.fan_out(
+            lambda using: list(search_teams(query, user, limit=limit, using=using))
+        )
+        teams = [team for shard in results for team in shard]
+        if all(hasattr(team, "rank") for team in teams):
+            teams.sort(key=lambda team: team.rank)
+        else:
+            teams.sort(key=lambda team: (team.name, team.pk))
+        return teams[:limit]
+
+class TeamAutocompleteUsersView(View):
+    """
+    ``?q=`` returns users whose username starts with it and who are
+    not on the team or invited to it yet. Only for the team's managers and
+    owners.
+    """
+
+    limit = 10
+
+    def get(self, request, pk):
+        team = get_object_or_404(Team.objects.using(sharding.shard_for(pk)), pk=pk)
+        if not team.is_owner_or_manager(request.user):
+            return HttpResponseForbidden()
+        users = autocomplete.users_to_invite(
+            team, request.GET.get("q", "").strip(), limit=self.limit
+        )
+        return JsonResponse({
+            "results": [{"id": pk, "username": username} for pk, username in users],
+        })
+
+class TeamAuthorizationView(View):
+    """
+    Batch role lookup for other services. POST ``{"pairs": [[user_id,
+    team_id], ...]}`` and get ``{"matrix": [[role, status] or null, ...]}`` in
+    the same order, null meaning no accepted membership. The ETag is derived
+    from the pairs and the cache versions of their teams, which every
+    membership change bumps, so a caller sending it back as If-None-Match
+    gets a 304 without any membership query. Only for TEAM_AUTHZ_ALLOWED_IPS,
+    and only straight to the app server, like ``first.metrics``.
+    """
+
+    max_pairs = 10000
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        # behind nginx every REMOTE_ADDR is 127.0.0.1; proxied requests are
+        # told apart by the X-Forwarded-For it adds
+        allowed = getattr(settings, "TEAM_AUTHZ_ALLOWED_IPS", ())
+        if "HTTP_X_FORWARDED_FOR" in request.META or \
+                request.META.get("REMOTE_ADDR") not in allowed:
+            return HttpResponseForbidden()
+        return super(TeamAuthorizationView, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request):
+        try:
+            pairs = [
+                (int(user_id), int(team_id))
+                for user_id, team_id in json.loads(request.body.decode("utf-8"))["pairs"]
+            ]
+        except (ValueError, TypeError, KeyError):
+            return HttpResponseBadRequest("Expected {\"pairs\": [[user_id, team_id], ...]}")
+        if len(pairs) > self.max_pairs:
+            return HttpResponseBadRequest("At most %d pairs" % self.max_pairs)
+
+        digest = hashlib.sha1(json.dumps(pairs).encode("ascii"))
+        for team_id in sorted(set(team_id for user_id, team_id in pairs)):
+            digest.update(("%d:%s;" % (team_id, cache.get_version(team_id))).encode("ascii"))
+        etag = '"%s"' % digest.hexdigest()
+        if etag in request.META.get("HTTP_IF_NONE_MATCH", ""):
+            response = HttpResponseNotModified()
+        else:
+            found = membership_matrix(pairs)
+            response = JsonResponse({
+                "matrix": [found.get(pair) for pair in pairs],
+            })
+        response["ETag"] = etag
+        return response
+
+class Echo(object):
+    """
+    File-like object for csv.writer that hands each row back to the caller.
+    """
+
+    def write(self, value):
+        return value
+
+class TeamRosterExportView(View):
+    """
+    Streams the accepted members of a team as CSV (default) or, with
+    ``?format=ndjson``, as JSON lines. Only for people on the team.
+    """
+
+    fields = ["user_id", "username", "role", "status", "joined_at"]
+
+    def get(self, request, pk):
+        team = get_object_or_404(Team.objects.using(sharding.shard_for(pk)), pk=pk)
+        if not team.is_on_team(request.user):
+            return HttpResponseForbidden()
+        entries = team.roster()
+        if request.GET.get("format") == "ndjson":
+            return StreamingHttpResponse(
+                self.ndjson(entries), content_type="application/x-ndjson"
+            )
+        response = StreamingHttpResponse(self.csv(entries), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="team-%d-roster.csv"' % team.pk
+        return response
+
+    def csv(self, entries):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.fields)
+        for entry in entries:
+            row = [getattr(entry, field) for field in self.fields]
+            if six.PY2:
+                # the Python 2 csv module only writes byte strings
+                row = [
+                    value.encode("utf-8") if isinstance(value, six.text_type) else value
+                    for value in row
+                ]
+            yield writer.writerow(row)
+
+    def ndjson(self, entries):
+        for entry in entries:
+            yield json.dumps(
+                dict((field, getattr(entry, field)) for field in self.fields),
+                cls=DjangoJSONEncoder,
+            ) + "\n"